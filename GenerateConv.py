@@ -1,12 +1,85 @@
 # -*- coding: utf-8 -*-
 import openai
 import json
-import glob
 import os
+import sys
+import time
+import asyncio
+import functools
 import concurrent.futures
 from tqdm import tqdm
 
-openai.api_key = ""
+from batch_io import read_results, write_requests
+from closure import ClosureStats, closure_prompt, detect_closure, parse_closure_answer
+from checkpoint import append_record, append_records, journal_path, read_journal, write_json_atomic
+from context import RollingContext
+from corpus_index import select_files
+from near_dup import NearDupIndex, cluster, opening_turn
+from prompt_budget import PromptBudget, compact_seed
+from ratelimit import RateLimiter
+from resilience import retry_call, retry_call_async
+from response_cache import ResponseCache
+from result_sink import ShardedSink
+from streaming import StreamAborted, StreamGuard, StreamStats, consume_stream, consume_stream_async
+from telemetry import Telemetry
+from tokens import count_message_tokens, count_tokens
+from turn_rules import RuleStats, check
+from usage import UsageStats
+
+openai.api_key = os.environ.get("OPENAI_API_KEY", "")  # or paste your key here
+openai.max_retries = 0  # retries are handled by resilience.retry_call
+BASE_URL = os.environ.get("OPENAI_BASE_URL")  # e.g. http://127.0.0.1:8000/v1 for fake_server.py
+if BASE_URL:
+    openai.base_url = BASE_URL.rstrip("/") + "/"  # the module-level client needs the trailing slash
+MODEL_NAME = "gpt-4o-mini"  # Or whichever model you have access to
+
+# Throughput is bounded by the account's rate limits, not by the worker count.
+USE_ASYNC = True                  # asyncio engine; False uses the thread pool below
+MAX_WORKERS = 50                  # thread pool size when USE_ASYNC is False
+MAX_CONCURRENCY = 200             # conversations in flight in the asyncio engine
+RPM_LIMIT = 500                   # requests per minute for your account tier
+TPM_LIMIT = 200_000               # tokens per minute for your account tier
+COMPLETION_TOKEN_ESTIMATE = 400   # reserved per call until the real usage is known
+CONTEXT_TOKEN_BUDGET = 6000       # transcript tokens sent verbatim before older turns are summarized
+CONTEXT_KEEP_TURNS = 8            # most recent turns that are never summarized
+RESUME = True                     # skip finished files, continue partial ones from their journal
+CHAT_LAYOUT = True                # system + alternating chat messages (prefix-cache friendly) instead of one flat prompt
+SEED_FORMAT = "json"              # seed in the client prompt: "indent" (original), "json" (minified), "text", "auto"
+SEED_MAX_TOKENS_PER_ROLE = 1500   # cap on seed tokens kept per role; None keeps the whole seed
+CACHE_MODE = "readwrite"          # response cache: "off", "readwrite" or "replay" (cache only, no API calls)
+STREAMING = True                  # stream completions: time-to-first-token / tokens-per-second metrics and early abort
+STREAM_MAX_TOKENS = 300           # abort a turn once it streams more tokens than this; None = no limit
+STREAM_MAX_PARAGRAPHS = 1         # therapist turns must stay in one paragraph (prompt rule); None = no check
+STREAM_MAX_REGENERATIONS = 2      # guarded retries after an abort; the attempt after that runs unguarded
+RULE_CHECK = True                 # check therapist turns against the prompt's mechanical rules (turn_rules.py)
+RULE_MAX_REGENERATIONS = 2        # regenerations of a rule-breaking therapist turn; the last attempt is kept
+REPEAT_THRESHOLD = 0.8            # therapist turn this similar to an earlier one: regenerate, then stop if it still repeats; None = off
+SEED_DEDUP_THRESHOLD = 0.7        # seeds whose opening turns are this similar (MinHash Jaccard) form one cluster; None = off
+SEED_CLUSTER_CAP = 1              # seeds generated per near-duplicate cluster
+SEED_CLUSTER_LOG = './results/seed_clusters.json'  # clusters with more than one seed: first seed -> all members
+CLOSURE_DETECTION = True          # stop a conversation early once it has come to a natural close
+CLOSURE_MIN_TURNS = 8             # never stop before this many turns
+CLOSURE_CLASSIFIER_MODEL = None   # small model that settles one-sided goodbyes, e.g. "gpt-4o-mini"; None = heuristic only
+CLOSURE_LOG = './results/stop_reasons.jsonl'  # one line per finished conversation: turns and why it stopped
+METRICS_LOG = './results/generation_metrics.jsonl'  # one line per model call: latency, tokens, retries, cost; None = summary only
+RESULT_SINK = "files"             # "files": one pretty <seed>_results.json each; "jsonl": sharded JSONL under ./results/shards
+SELECT = {}                       # seeds to run, via the corpus index: e.g. {"sample": 500, "seed": 1, "min_turns": 10}
+MODALITIES = ["cbt"]              # therapist prompts to run: any of "cbt", "sfbt", "humanistic"
+SWEEP_MODELS = [MODEL_NAME]       # models to run; every (seed, modality, model) is one job in the same pool
+ROLE_MODELS = {}                  # per-role overrides of the job's model: "client", "therapist", "summary",
+                                  # e.g. {"client": "gpt-4o-mini", "summary": "gpt-4o-mini"} to sweep only the therapist
+
+LIMITER = RateLimiter(rpm=RPM_LIMIT, tpm=TPM_LIMIT)
+USAGE = UsageStats()
+BUDGET = PromptBudget()
+CACHE = ResponseCache(mode=CACHE_MODE)
+STREAMS = StreamStats()
+THERAPIST_GUARD = StreamGuard(max_tokens=STREAM_MAX_TOKENS, max_paragraphs=STREAM_MAX_PARAGRAPHS)
+CLIENT_GUARD = StreamGuard(max_tokens=STREAM_MAX_TOKENS)
+CLOSURES = ClosureStats()
+RULE_STATS = RuleStats()
+TELEMETRY = Telemetry(METRICS_LOG)
+SINK = ShardedSink('./results/shards', 'conversations') if RESULT_SINK == "jsonl" else None
 
 therapist_Humanistic_prompt = """
 # Role: System (Humanistic Therapist Instructions)
@@ -256,13 +329,17 @@ Important Additional Requirements
   - Maintain a clear, respectful, supportive tone while ensuring the dialogue sounds genuine and and humam, not robotic or scripted.
 """
 
-def build_client_prompt(conv_data_str):
-    """
-    Build the 'client' system prompt.
-    conv_data_str is the entire JSON from the file, turned into a string.
-    We will have instructions referencing that entire conversation as context.
-    """
-    return """
+THERAPIST_PROMPTS = {
+    "cbt": therapist_cbt_prompt,
+    "sfbt": therapist_sfbt_prompt,
+    "humanistic": therapist_Humanistic_prompt,
+}
+
+def therapist_role(modality):
+    """Role label of generated therapist turns, e.g. "therapist_cbt_prompt" (what evaluation.py expects)."""
+    return f"therapist_{modality}_prompt"
+
+CLIENT_PROMPT_INSTRUCTIONS = """
 # Role: You will act as the "client" in a psychological counseling session. You have access to the previous conversation for context. Your task is to produce a realistic, natural, and emotionally genuine "client" reply, accurately reflecting common psychological struggles and conversational authenticity.
 
 1. Language and Tone
@@ -286,15 +363,19 @@ def build_client_prompt(conv_data_str):
 5. Maintaining Dialogue Flow
   - Naturally react to the therapist’s most recent message in a way that deepens the conversation.
   - If the therapist gives suggestions or exercises, honestly reflect any hesitation, resistance, or uncertainty you feel.
+"""
 
+CLIENT_PROMPT_SEED = """
 ## Sample Reference Conversation (for context only)
 
 ```
 [START OF ORIGINAL CONVERSATION JSON]
-""" + conv_data_str + """
+{seed}
 [END OF ORIGINAL CONVERSATION JSON]
 ```
+"""
 
+CLIENT_PROMPT_RESPONSE_STEPS = """
 Instructions for Generating the Client Response
 
 1. Review the Therapist’s Latest Message
@@ -307,24 +388,154 @@ Instructions for Generating the Client Response
 Begin your client response below:
 """
 
-def ask_gpt(prompt):
-    model_choice = "gpt-4o-mini"  # Or whichever model you have access to
+def build_client_prompt(conv_data_str):
+    """
+    Build the 'client' system prompt.
+    conv_data_str is the entire JSON from the file, turned into a string.
+    We will have instructions referencing that entire conversation as context.
+    """
+    return (CLIENT_PROMPT_INSTRUCTIONS
+            + CLIENT_PROMPT_SEED.format(seed=conv_data_str)
+            + CLIENT_PROMPT_RESPONSE_STEPS)
+
+def build_client_system_prompt(conv_data_str):
+    """
+    Same content as build_client_prompt, reordered for prompt caching: the
+    instructions shared by every conversation come first and the per-seed
+    conversation comes last.
+    """
+    return (CLIENT_PROMPT_INSTRUCTIONS
+            + CLIENT_PROMPT_RESPONSE_STEPS
+            + CLIENT_PROMPT_SEED.format(seed=conv_data_str))
+
+def _limited_create(estimate, span, **request):
+    span.attempt(LIMITER.acquire(estimate))
+    return openai.chat.completions.create(**request)
+
+async def _limited_create_async(client, estimate, span, **request):
+    span.attempt(await LIMITER.acquire_async(estimate))
+    return await client.chat.completions.create(**request)
+
+def _streamed_create(estimate, span, guard, **request):
+    span.attempt(LIMITER.acquire(estimate))
+    started = time.perf_counter()
+    stream = openai.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+    return consume_stream(stream, guard, request["model"], started)
+
+async def _streamed_create_async(client, estimate, span, guard, **request):
+    span.attempt(await LIMITER.acquire_async(estimate))
+    started = time.perf_counter()
+    stream = await client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+    return await consume_stream_async(stream, guard, request["model"], started)
+
+def _as_messages(prompt):
+    """A flat prompt string becomes a single user message; message lists pass through."""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
+
+def _record_usage(estimate, usage):
+    if usage:
+        LIMITER.settle(estimate, usage.total_tokens)
+        USAGE.record(usage)
+
+def _attempt_guard(guard, attempt):
+    # After STREAM_MAX_REGENERATIONS aborts, take whatever the model produces.
+    return guard if attempt < STREAM_MAX_REGENERATIONS else None
+
+def _record_abort(estimate, exc):
+    STREAMS.record_abort(exc)
+    # Only the prompt and the tokens streamed before the abort were spent.
+    LIMITER.settle(estimate, estimate - COMPLETION_TOKEN_ESTIMATE + exc.tokens)
+
+def _ask_streaming(request, estimate, span, guard):
+    for attempt in range(STREAM_MAX_REGENERATIONS + 1):
+        try:
+            result = retry_call(_streamed_create, estimate, span, _attempt_guard(guard, attempt), **request)
+        except StreamAborted as exc:
+            _record_abort(estimate, exc)
+            continue
+        STREAMS.record(result)
+        span.ttft = result.ttft
+        return result.content, result.usage
+
+async def _ask_streaming_async(client, request, estimate, span, guard):
+    for attempt in range(STREAM_MAX_REGENERATIONS + 1):
+        try:
+            result = await retry_call_async(_streamed_create_async, client, estimate, span,
+                                            _attempt_guard(guard, attempt), **request)
+        except StreamAborted as exc:
+            _record_abort(estimate, exc)
+            continue
+        STREAMS.record(result)
+        span.ttft = result.ttft
+        return result.content, result.usage
+
+def _request(prompt, model, variant):
+    request = {"model": model or MODEL_NAME, "messages": _as_messages(prompt)}
+    if variant:
+        request["seed"] = variant  # a regeneration: new sample, and its own cache entry
+    return request
+
+def ask_gpt(prompt, guard=None, model=None, role=None, modality=None, variant=0):
+    """
+    One completion (cached, retried, streamed when STREAMING); role/modality
+    label it in TELEMETRY. A non-zero `variant` asks again for a prompt whose
+    earlier answer was rejected.
+    """
+    request = _request(prompt, model, variant)
+    estimate = count_message_tokens(request["messages"], request["model"]) + COMPLETION_TOKEN_ESTIMATE
+    span = TELEMETRY.span(request["model"], role, modality)
     try:
-        # Make an API call to OpenAI
-        response = openai.chat.completions.create(
-            model=model_choice,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
-        )
-        return response.choices[0].message.content
+        cached = CACHE.get(request)
+        if cached is not None:
+            TELEMETRY.finish(span, status="cached")
+            return cached
+        # Make an API call to OpenAI; transient errors are retried with backoff
+        if STREAMING:
+            content, usage = _ask_streaming(request, estimate, span, guard)
+        else:
+            response = retry_call(_limited_create, estimate, span, **request)
+            content, usage = response.choices[0].message.content, response.usage
     except Exception as e:
+        TELEMETRY.finish(span, status=type(e).__name__)
         print(f"OpenAI API error: {e}")
         return None
+    TELEMETRY.finish(span, usage)
+    _record_usage(estimate, usage)
+    CACHE.put(request, content)
+    return content
+
+async def ask_gpt_async(client, prompt, guard=None, model=None, role=None, modality=None, variant=0):
+    request = _request(prompt, model, variant)
+    estimate = count_message_tokens(request["messages"], request["model"]) + COMPLETION_TOKEN_ESTIMATE
+    span = TELEMETRY.span(request["model"], role, modality)
+    try:
+        cached = CACHE.get(request)
+        if cached is not None:
+            TELEMETRY.finish(span, status="cached")
+            return cached
+        if STREAMING:
+            content, usage = await _ask_streaming_async(client, request, estimate, span, guard)
+        else:
+            response = await retry_call_async(_limited_create_async, client, estimate, span, **request)
+            content, usage = response.choices[0].message.content, response.usage
+    except Exception as e:
+        TELEMETRY.finish(span, status=type(e).__name__)
+        print(f"OpenAI API error: {e}")
+        return None
+    TELEMETRY.finish(span, usage)
+    _record_usage(estimate, usage)
+    CACHE.put(request, content)
+    return content
 
-def build_full_prompt(next_role, conversation, client_instructions, therapist_instructions):
+def build_full_prompt(next_role, conversation, client_instructions, therapist_instructions, context=None):
     system_prompt = client_instructions if next_role == "client" else therapist_instructions
 
+    if context is not None:
+        # RollingContext already holds the rendered (and possibly summarized) transcript
+        return system_prompt + "\n\n" + context.render()
+
     conversation_text = ""
     for msg in conversation:
         role_label = "Therapist" if "therapist" in msg["role"] else "Client"
@@ -332,58 +543,426 @@ def build_full_prompt(next_role, conversation, client_instructions, therapist_in
 
     return system_prompt + "\n\n" + conversation_text.strip()
 
-def process_single_file(file_path, therapist_prompt, num_turns=20):
-    print(f"Processing: {file_path}")
+def build_chat_messages(next_role, client_instructions, therapist_instructions, context):
+    """
+    The same request as build_full_prompt, laid out for provider-side prompt
+    caching: the static instructions go first as a system message and the
+    transcript follows as alternating user/assistant turns. Each speaker's
+    requests then only ever grow at the end, so consecutive calls share a
+    byte-identical prefix (and the therapist prefix is shared across seeds).
+    """
+    system_prompt = client_instructions if next_role == "client" else therapist_instructions
+    return [{"role": "system", "content": system_prompt}] + context.chat_messages(next_role)
+
+def _tagged(file_path, tag):
+    """seed.json -> seed_<tag>.json, so sweep outputs and journals of one seed don't collide."""
+    return file_path if not tag else os.path.splitext(file_path)[0] + f"_{tag}.json"
+
+def result_path_for(file_path, tag=None):
+    base_name = os.path.basename(_tagged(file_path, tag))
+    return os.path.join('./results', base_name.replace(".json", "_results.json"))
+
+def result_id(file_path, tag=None):
+    """Record id of a finished conversation in the JSONL sink, e.g. "seed0001_cbt"."""
+    return os.path.splitext(os.path.basename(_tagged(file_path, tag)))[0]
+
+def result_exists(file_path, tag=None):
+    if SINK is not None:
+        return result_id(file_path, tag) in SINK
+    return os.path.exists(result_path_for(file_path, tag))
+
+def load_seed(file_path):
+    """
+    Read and pre-process one seed file. A sweep does this once per seed and
+    shares the result between all of its (modality, model) jobs. None if the
+    file holds no turns.
+    """
     with open(file_path, 'r', encoding='utf-8') as f:
         conversation_data = json.load(f)
-
     if not conversation_data:
-        print(f"Skipping empty file: {file_path}")
-        return
+        return None
+    conv_data_str = compact_seed(conversation_data, SEED_FORMAT, SEED_MAX_TOKENS_PER_ROLE, MODEL_NAME)
+    if CHAT_LAYOUT:
+        client_system_prompt = build_client_system_prompt(conv_data_str)
+    else:
+        client_system_prompt = build_client_prompt(conv_data_str)
+    return {
+        "first_turn": conversation_data[0].get("content", "（空白）"),
+        "client_system_prompt": client_system_prompt,
+        "seed_tokens": count_tokens(conv_data_str, MODEL_NAME),
+    }
+
+@functools.lru_cache(maxsize=256)
+def shared_seed(file_path):
+    """
+    load_seed, kept for the most recent seeds only: the jobs of one seed in a
+    sweep start close together and share the work, and a long run does not
+    hold every compacted seed.
+    """
+    return load_seed(file_path)
+
+class ConversationJob:
+    """
+    State of one generated conversation, advanced one turn at a time.
+    The job only builds prompts and records replies; the caller decides how
+    the model is called (thread pool or asyncio).
+
+    Every turn is appended to a journal under ./results/checkpoints as soon as
+    it arrives. With resume=True the job picks up from the last journaled turn.
 
-    conv_data_str = json.dumps(conversation_data, ensure_ascii=False, indent=2)
-    client_system_prompt = build_client_prompt(conv_data_str)
+    The transcript lives in a RollingContext; when it outgrows its token budget
+    the next request is a summary call instead of a turn, and the returned
+    summary is journaled too so a resume never pays for it twice.
 
-    conversation = [{"role": "client", "content": conversation_data[0].get("content", "（空白）")}]
-    current_role = "client"
+    After each turn the job checks whether the conversation has closed
+    naturally (closure.detect_closure) and, if so, stops before num_turns.
+    An uncertain case leaves a yes/no question in closure_question for the
+    caller to put to CLOSURE_CLASSIFIER_MODEL.
 
-    for _ in range(1, num_turns):
-        next_role = "therapist_Humanistic" if current_role == "client" else "client"
+    `modality` picks the therapist prompt (THERAPIST_PROMPTS) and role label;
+    `tag` distinguishes the outputs of several jobs generated from one seed.
+    """
 
-        full_prompt = build_full_prompt(
-            next_role=next_role,
-            conversation=conversation,
-            client_instructions=client_system_prompt,
-            therapist_instructions=therapist_prompt
+    def __init__(self, file_path, modality="cbt", num_turns=20, resume=False, model=None, tag=None, seed=None):
+        self.file_path = file_path
+        self.modality = modality
+        self.therapist_prompt = THERAPIST_PROMPTS[modality]
+        self.therapist_role = therapist_role(modality)
+        self.model = model or MODEL_NAME
+        self.tag = tag
+        self.num_turns = num_turns
+        self.result_path = result_path_for(file_path, tag)
+        self.journal_path = journal_path(_tagged(file_path, tag))
+        self.conversation = []
+        self.context = RollingContext(CONTEXT_TOKEN_BUDGET, CONTEXT_KEEP_TURNS, MODEL_NAME)
+        self.stop_reason = None
+        self.closure_question = None
+        self.last_request_tokens = 0
+        self.therapist_turns = NearDupIndex(REPEAT_THRESHOLD) if REPEAT_THRESHOLD is not None else None
+        self.repeating = False
+        self.rule_check = None                 # (violations, attempt) of the reply add_reply will accept
+        self._pending = []                     # journal records not yet written (see flush_journal)
+        self._truncate = False
+
+        seed = seed or shared_seed(file_path)
+        if not seed:
+            return
+
+        self.component_tokens = {
+            "client_instructions": count_tokens(CLIENT_PROMPT_INSTRUCTIONS + CLIENT_PROMPT_RESPONSE_STEPS, MODEL_NAME),
+            "seed": seed["seed_tokens"],
+            "therapist_instructions": count_tokens(self.therapist_prompt, MODEL_NAME),
+        }
+        self.client_system_prompt = seed["client_system_prompt"]
+
+        if resume:
+            for record in read_journal(self.journal_path):
+                if "summary" in record:
+                    self.context.apply_summary(record["summary"], record["folded"])
+                elif "stop" in record:
+                    self.stop_reason = record["stop"]
+                else:
+                    self._append({"role": record["role"], "content": record["content"]})
+        if not self.conversation:
+            self._append({"role": "client", "content": seed["first_turn"]})
+            self._journal(self.conversation[0], truncate=True)
+            self.flush_journal()
+
+    @property
+    def done(self):
+        return (not self.conversation or self.stop_reason is not None
+                or len(self.conversation) >= self.num_turns)
+
+    @property
+    def next_role(self):
+        return self.therapist_role if self.conversation[-1]["role"] == "client" else "client"
+
+    @property
+    def call_role(self):
+        """Telemetry label of the request next_prompt returns: "summary", "client" or "therapist"."""
+        if self.context.needs_fold():
+            return "summary"
+        return "client" if self.next_role == "client" else "therapist"
+
+    @property
+    def call_model(self):
+        """Model for the request next_prompt returns: ROLE_MODELS for its role, else the job's model."""
+        return ROLE_MODELS.get(self.call_role) or self.model
+
+    def request_id(self):
+        """Identifies the request next_prompt would return now; stable across restarts."""
+        kind = "summary" if self.context.needs_fold() else self.next_role
+        return f"{os.path.basename(_tagged(self.file_path, self.tag))}|{len(self.conversation)}|{kind}"
+
+    def next_prompt(self):
+        if self.context.needs_fold():
+            prompt = self.context.fold_prompt()
+            BUDGET.record({"summary_request": count_tokens(prompt, MODEL_NAME)})
+            return prompt
+        if self.next_role == "client":
+            components = {
+                "client_instructions": self.component_tokens["client_instructions"],
+                "seed": self.component_tokens["seed"],
+                "transcript": self.context.tokens,
+            }
+        else:
+            components = {
+                "therapist_instructions": self.component_tokens["therapist_instructions"],
+                "transcript": self.context.tokens,
+            }
+        BUDGET.record(components)
+        self.last_request_tokens = sum(components.values())
+        if CHAT_LAYOUT:
+            return build_chat_messages(
+                next_role=self.next_role,
+                client_instructions=self.client_system_prompt,
+                therapist_instructions=self.therapist_prompt,
+                context=self.context
+            )
+        return build_full_prompt(
+            next_role=self.next_role,
+            conversation=self.conversation,
+            client_instructions=self.client_system_prompt,
+            therapist_instructions=self.therapist_prompt,
+            context=self.context
         )
 
-        new_content = ask_gpt(full_prompt)
-        if not new_content:
-            print(f"No response for file: {file_path}")
-            break
+    def reply_guard(self):
+        """Streaming guard for the reply to next_prompt (summaries are never cut short)."""
+        if self.context.needs_fold():
+            return None
+        return CLIENT_GUARD if self.next_role == "client" else THERAPIST_GUARD
+
+    def add_reply(self, content):
+        """Record the reply to the request next_prompt returned."""
+        if self.context.needs_fold():
+            upto = self.context.fold_point()
+            self.context.apply_summary(content, upto)
+            self._pending.append({"summary": self.context.summary, "folded": upto})
+            return
+        self._append({"role": self.next_role, "content": content.strip()})
+        self._journal(self.conversation[-1])
+        if self.rule_check is not None:
+            violations, attempt = self.rule_check
+            self.rule_check = None
+            RULE_STATS.record(violations, "kept" if violations else "fixed" if attempt else None)
+        if self.repeating:
+            self.repeating = False
+            self.stop("repetition")
+        self._check_closure()
+
+    def needs_regeneration(self, content, attempt):
+        """
+        Check a therapist reply to next_prompt against the prompt's rules
+        (turn_rules) and the earlier therapist turns; True to ask again. A reply
+        that still repeats an earlier turn when the attempts run out is kept
+        and ends the conversation (see add_reply). RULE_STATS counts each
+        regeneration here and each accepted turn, once, in add_reply.
+        """
+        self.rule_check = None
+        if not content or self.context.needs_fold() or self.next_role == "client":
+            return False
+        if not RULE_CHECK and self.therapist_turns is None:
+            return False
+        violations = check(content, self.therapist_prompt) if RULE_CHECK else []
+        if self.therapist_turns is not None and self.therapist_turns.query(content):
+            violations.append("repeat")
+        retry = bool(violations) and attempt < RULE_MAX_REGENERATIONS
+        if retry:
+            RULE_STATS.regenerated()
+        else:
+            self.rule_check = (violations, attempt)
+        self.repeating = "repeat" in violations and not retry
+        return retry
+
+    def _check_closure(self):
+        self.closure_question = None
+        if not CLOSURE_DETECTION or len(self.conversation) < CLOSURE_MIN_TURNS or self.done:
+            return
+        verdict, reason = detect_closure(self.conversation)
+        if verdict == "closed":
+            self.stop(reason)
+        elif verdict == "maybe" and CLOSURE_CLASSIFIER_MODEL:
+            self.closure_question = closure_prompt(self.conversation)
+
+    def answer_closure(self, answer):
+        """Record the classifier's answer to closure_question."""
+        self.closure_question = None
+        if parse_closure_answer(answer):
+            self.stop("classifier")
+
+    def stop(self, reason):
+        self.stop_reason = reason
+        self._pending.append({"stop": reason})
+
+    def _append(self, msg):
+        self.conversation.append(msg)
+        self.context.append(msg)
+        if self.therapist_turns is not None and msg["role"] == self.therapist_role:
+            self.therapist_turns.add(len(self.conversation) - 1, msg["content"])
+
+    def _journal(self, msg, truncate=False):
+        if truncate:
+            self._pending, self._truncate = [], True
+        self._pending.append({"turn": len(self.conversation) - 1, "role": msg["role"], "content": msg["content"]})
+
+    def flush_journal(self):
+        """
+        Write the journal records of the replies added since the last flush
+        (one open and fsync). Call it before the next model call; the async
+        engine runs it in a worker thread so the fsync never blocks the loop.
+        """
+        if not self._pending:
+            return
+        records, self._pending = self._pending, []
+        append_records(self.journal_path, records, truncate=self._truncate)
+        self._truncate = False
+
+    def save(self):
+        reason = self.stop_reason or "max_turns"
+        if SINK is not None:
+            SINK.append(result_id(self.file_path, self.tag), {
+                "seed": os.path.basename(self.file_path),
+                "modality": self.modality,
+                "model": self.model,
+                "stop_reason": reason,
+                "conversation": self.conversation,
+            })
+        else:
+            write_json_atomic(self.result_path, self.conversation, ensure_ascii=False, indent=2)
+        self._pending = []                     # the finished result supersedes the journal
+        os.remove(self.journal_path)
+        skipped = max(0, self.num_turns - len(self.conversation))
+        CLOSURES.record(reason, skipped, skipped * self.last_request_tokens)
+        append_record(CLOSURE_LOG, {
+            "file": os.path.basename(self.file_path),
+            "modality": self.modality,
+            "model": self.model,
+            "turns": len(self.conversation),
+            "reason": reason,
+        })
+
+def process_single_file(file_path, modality="cbt", num_turns=20, resume=False, model=None, tag=None, seed=None):
+    print(f"Processing: {file_path}" + (f" [{tag}]" if tag else ""))
+    job = ConversationJob(file_path, modality, num_turns, resume=resume, model=model, tag=tag, seed=seed)
+    if not job.conversation:
+        print(f"Skipping empty file: {file_path}")
+        return
 
-        conversation.append({"role": next_role, "content": new_content.strip()})
-        current_role = next_role
+    while not job.done:
+        prompt = job.next_prompt()
+        for attempt in range(RULE_MAX_REGENERATIONS + 1):
+            new_content = ask_gpt(prompt, job.reply_guard(), model=job.call_model,
+                                  role=job.call_role, modality=job.modality, variant=attempt)
+            if not job.needs_regeneration(new_content, attempt):
+                break
+        if not new_content:
+            # Leave the journal in place so a resumed run continues from here.
+            print(f"No response for file: {file_path} (stopped after {len(job.conversation)} turns)")
+            return
+        job.add_reply(new_content)
+        job.flush_journal()
+        if job.closure_question:
+            job.answer_closure(ask_gpt(job.closure_question, model=CLOSURE_CLASSIFIER_MODEL,
+                                       role="closure", modality=job.modality))
+
+    job.save()
+
+async def process_single_file_async(client, file_path, modality="cbt", num_turns=20, resume=False,
+                                    model=None, tag=None, seed=None):
+    # Journal and result writes fsync; they run in worker threads so they never stall the event loop.
+    job = await asyncio.to_thread(ConversationJob, file_path, modality, num_turns, resume=resume,
+                                  model=model, tag=tag, seed=seed)
+    if not job.conversation:
+        print(f"Skipping empty file: {file_path}")
+        return
 
-    os.makedirs('./results', exist_ok=True)
-    base_name = os.path.basename(file_path)
-    result_name = base_name.replace(".json", "_results.json")
-    result_path = os.path.join('./results', result_name)
+    while not job.done:
+        prompt = job.next_prompt()
+        for attempt in range(RULE_MAX_REGENERATIONS + 1):
+            new_content = await ask_gpt_async(client, prompt, job.reply_guard(), model=job.call_model,
+                                              role=job.call_role, modality=job.modality, variant=attempt)
+            if not job.needs_regeneration(new_content, attempt):
+                break
+        if not new_content:
+            print(f"No response for file: {file_path} (stopped after {len(job.conversation)} turns)")
+            return
+        job.add_reply(new_content)
+        await asyncio.to_thread(job.flush_journal)
+        if job.closure_question:
+            job.answer_closure(await ask_gpt_async(client, job.closure_question, model=CLOSURE_CLASSIFIER_MODEL,
+                                                   role="closure", modality=job.modality))
+
+    await asyncio.to_thread(job.save)
+
+async def main_async(jobs, resume=False):
+    # One client and one limiter for every conversation; the semaphore only
+    # caps how many conversations are in flight (and in memory) at once.
+    client = openai.AsyncOpenAI(api_key=openai.api_key or None, base_url=BASE_URL, max_retries=0)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def run(spec):
+        async with semaphore:
+            try:
+                await process_single_file_async(client, resume=resume, **spec)
+            except Exception as e:
+                print(f"Error processing {spec['file_path']}: {e}")
 
-    with open(result_path, 'w', encoding='utf-8') as rf:
-        json.dump(conversation, rf, ensure_ascii=False, indent=2)
+    tasks = [asyncio.create_task(run(spec)) for spec in jobs]
+    try:
+        for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing Conversations"):
+            await task
+    finally:
+        await client.close()
 
-def main():
-    json_files = glob.glob(os.path.join('./data', '*.json'))
+def batch_step(requests_path, results_path=None, modality="cbt", num_turns=20):
+    """
+    Advance every unfinished conversation by one request in offline batch mode.
 
-    if not json_files:
-        print("No JSON files found in ./data. Please add some.")
-        return
+    Replies from results_path (a batch output JSONL), if given, are journaled
+    first; then the next request of every unfinished conversation is written
+    to requests_path in the batch input format. Run it again with the new
+    results until it writes no requests. Conversation state lives entirely in
+    the journals, so steps can be hours apart.
 
-    max_workers = 50  # Adjust based on API rate limits
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(process_single_file, file, therapist_cbt_prompt): file for file in json_files}
+    Therapist replies are checked against the rules and for repetition as
+    they are read, but never regenerated: a rule-breaking reply is kept (and
+    counted in RULE_STATS), and a repeating one ends the conversation.
+    """
+    json_files = select_files('./data', **SELECT)
+    if SEED_DEDUP_THRESHOLD is not None:
+        json_files = dedup_seeds(json_files)   # same seeds as the online modes
+    replies = read_results(results_path) if results_path else {}
+    requests = []
+    finished = 0
+    for file in json_files:
+        if result_exists(file):
+            continue
+        job = ConversationJob(file, modality, num_turns, resume=True)
+        if not job.conversation:
+            continue
+        content = replies.get(job.request_id())
+        if content:
+            job.needs_regeneration(content, RULE_MAX_REGENERATIONS)
+            job.add_reply(content)
+            job.flush_journal()
+        if job.done:
+            job.save()
+            finished += 1
+            continue
+        body = {"model": job.call_model, "messages": _as_messages(job.next_prompt())}
+        requests.append((job.request_id(), body))
+
+    count = write_requests(requests_path, requests)
+    print(f"Batch step: {len(replies)} results read, {finished} conversations finished, "
+          f"{count} requests written to {requests_path}")
+    if RULE_STATS.turns:
+        print(f"Therapist turn rules: {RULE_STATS.summary()}")
+    return count
+
+def run_thread_pool(jobs, resume=False):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(process_single_file, resume=resume, **spec): spec["file_path"] for spec in jobs}
 
         for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Processing Conversations"):
             try:
@@ -391,5 +970,82 @@ def main():
             except Exception as e:
                 print(f"Error processing {futures[future]}: {e}")
 
+def sweep_jobs(json_files, modalities, models):
+    """
+    One job spec per (seed, modality, model). Outputs are tagged with the
+    modality (and the model, when there are several) unless the sweep is a
+    single plain run, which keeps the original <seed>_results.json names.
+    """
+    unknown = [m for m in modalities if m not in THERAPIST_PROMPTS]
+    if unknown:
+        raise ValueError(f"Unknown modalities {unknown}; expected some of {sorted(THERAPIST_PROMPTS)}")
+    tagged = len(modalities) * len(models) > 1
+    jobs = []
+    for file in json_files:
+        for modality in modalities:
+            for model in models:
+                tag = None
+                if tagged:
+                    tag = modality if len(models) == 1 else f"{modality}_{model.replace('/', '-')}"
+                jobs.append({"file_path": file, "modality": modality, "model": model, "tag": tag})
+    return jobs
+
+def dedup_seeds(json_files):
+    """
+    json_files without the seeds beyond SEED_CLUSTER_CAP in each cluster of
+    near-identical opening turns (near_dup). Only the opening turn of each
+    file is read. Clusters with more than one seed are written to SEED_CLUSTER_LOG.
+    """
+    clusters = cluster(((file, opening_turn(file)) for file in json_files), threshold=SEED_DEDUP_THRESHOLD)
+    skipped = {file for members in clusters.values() for file in members[SEED_CLUSTER_CAP:]}
+    shared = {os.path.basename(first): [os.path.basename(file) for file in members]
+              for first, members in clusters.items() if len(members) > 1}
+    write_json_atomic(SEED_CLUSTER_LOG, shared, ensure_ascii=False, indent=2)
+    if skipped:
+        print(f"Near-duplicate seeds: {len(skipped)} skipped, {len(shared)} clusters of near-identical "
+              f"opening turns kept to {SEED_CLUSTER_CAP} seed(s) each (see {SEED_CLUSTER_LOG}).")
+    return [file for file in json_files if file not in skipped]
+
+def main(use_async=USE_ASYNC, resume=RESUME, modalities=MODALITIES, models=SWEEP_MODELS, select=SELECT):
+    json_files = select_files('./data', **select)
+
+    if not json_files:
+        print("No JSON files found in ./data (or none match SELECT). Please add some.")
+        return
+
+    # Clusters are built from every selected seed, so a resumed run skips the same ones.
+    if SEED_DEDUP_THRESHOLD is not None:
+        json_files = dedup_seeds(json_files)
+
+    jobs = sweep_jobs(json_files, modalities, models)
+    if resume:
+        pending = [spec for spec in jobs if not result_exists(spec["file_path"], spec["tag"])]
+        print(f"Resuming: {len(jobs) - len(pending)} conversations already finished, {len(pending)} to go.")
+        jobs = pending
+
+    if use_async:
+        asyncio.run(main_async(jobs, resume=resume))
+    else:
+        run_thread_pool(jobs, resume=resume)
+    print(f"Token usage: {USAGE.summary()}")
+    print(f"Response cache: {CACHE.summary()}")
+    if STREAMING:
+        print(f"Streaming: {STREAMS.summary()}")
+    print(f"Stop reasons: {CLOSURES.summary()}")
+    if RULE_CHECK or REPEAT_THRESHOLD is not None:
+        print(f"Therapist turn rules: {RULE_STATS.summary()}")
+    print(f"Input tokens by prompt component:\n{BUDGET.summary()}")
+    print(f"Model calls by model | role | modality:\n{TELEMETRY.summary()}")
+    if METRICS_LOG:
+        TELEMETRY.write_summary(os.path.splitext(METRICS_LOG)[0] + "_summary.json")
+
 if __name__ == "__main__":
-    main()
+    # python GenerateConv.py batch <requests.jsonl> [<results.jsonl>]  → one offline batch step
+    # python GenerateConv.py sweep cbt,sfbt,humanistic [<model>,<model>]  → every modality (× model) in one run
+    if len(sys.argv) > 2 and sys.argv[1] == "batch":
+        batch_step(*sys.argv[2:4])
+    elif len(sys.argv) > 2 and sys.argv[1] == "sweep":
+        models = sys.argv[3].split(",") if len(sys.argv) > 3 else SWEEP_MODELS
+        main(modalities=sys.argv[2].split(","), models=models)
+    else:
+        main()
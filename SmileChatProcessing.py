@@ -1,41 +1,255 @@
 #!/usr/bin/env python3
 import os
 import json
+import hashlib
+import concurrent.futures
 
-def remove_annotations(input_dir='./data', output_dir='./results'):
+from checkpoint import write_json_atomic
+from result_sink import ShardedSink, dumps
+
+MANIFEST_NAME = '.smilechat_manifest.json'  # per output dir: size, mtime and sha256 of every cleaned input
+CHUNK_SIZE = 1 << 16                        # characters read at a time when streaming a file
+
+_DECODER = json.JSONDecoder()
+
+
+class _ArrayReader:
+    """Pulls JSON values out of a text file a chunk at a time."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.f.read(CHUNK_SIZE)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character, or None at end of file."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return None
+
+    def value(self):
+        self.peek()  # raw_decode does not skip leading whitespace
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self.fill():
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof:
+                # A number or literal may continue in the next chunk.
+                self.fill()
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_array(f):
+    """
+    Yield the elements of the top-level JSON array in text file `f` one by one,
+    so a file never has to fit in memory. Any other top-level value is loaded
+    whole and iterated the way the original list comprehension did.
+    """
+    reader = _ArrayReader(f)
+    if reader.peek() != "[":
+        f.seek(0)
+        yield from json.load(f)
+        return
+    reader.pos += 1
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        following = reader.peek()
+        if following == ",":
+            reader.pos += 1
+        elif following == "]":
+            return
+        else:
+            raise json.JSONDecodeError("Expected ',' or ']'", reader.buf, reader.pos)
+
+
+def clean_entries(entries):
+    """Drop the 'annotation' field (and everything else but role/content) from each entry."""
+    for entry in entries:
+        if isinstance(entry, dict):
+            yield {
+                'role': entry.get('role'),
+                'content': entry.get('content')
+            }
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_cleaned(input_path, output_path):
+    """
+    Stream input_path into output_path with the same layout json.dump(indent=2)
+    produces; written to a temporary file and renamed, so a failed parse leaves
+    no partial output. Returns the number of entries written.
+    """
+    tmp_path = output_path + '.tmp'
+    count = 0
+    try:
+        with open(input_path, 'r', encoding='utf-8') as infile, \
+                open(tmp_path, 'w', encoding='utf-8') as outfile:
+            for cleaned in clean_entries(iter_json_array(infile)):
+                item = json.dumps(cleaned, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                outfile.write(('[\n  ' if count == 0 else ',\n  ') + item)
+                count += 1
+            outfile.write('\n]' if count else '[]')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def write_sink_line(input_path, record_id, line_path):
+    """
+    Stream input_path into line_path as one finished sink line,
+    {"id": record_id, "record": [cleaned entries]}, without holding the
+    entries in memory. Returns the number of entries written.
+    """
+    count = 0
+    try:
+        with open(input_path, 'r', encoding='utf-8') as infile, open(line_path, 'wb') as outfile:
+            outfile.write(b'{"id":' + dumps(record_id) + b',"record":[')
+            for cleaned in clean_entries(iter_json_array(infile)):
+                outfile.write((b',' if count else b'') + dumps(cleaned))
+                count += 1
+            outfile.write(b']}\n')
+    except BaseException:
+        if os.path.exists(line_path):
+            os.remove(line_path)
+        raise
+    return count
+
+
+def _process_file(input_path, output_path, known_sha256, sink_line):
+    """
+    Worker: hash the input and, unless it matches the manifest, clean it.
+    Returns (status, sha256, payload) where status is "unchanged", "cleaned"
+    or "invalid"; payload is the entry count. For JSONL output the worker
+    writes the finished sink line to `sink_line` and the parent process
+    appends that file to the sink.
+    """
+    sha256 = file_sha256(input_path)
+    if sha256 == known_sha256:
+        return "unchanged", sha256, None
+    try:
+        if sink_line:
+            return "cleaned", sha256, write_sink_line(input_path, os.path.basename(input_path), sink_line)
+        return "cleaned", sha256, write_cleaned(input_path, output_path)
+    except json.JSONDecodeError as e:
+        return "invalid", sha256, str(e)
+
+
+def _load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def remove_annotations(input_dir='./data', output_dir='./results', output_format='json',
+                       workers=None, incremental=True):
     """
     Reads all .json files in the input directory, removes the 'annotation' field
     from each entry, and writes the cleaned data to the output directory.
+    With output_format='jsonl' the cleaned conversations are appended to
+    sharded JSONL under <output_dir>/shards instead, keyed by file name.
+
+    Files are parsed as streams in a pool of `workers` processes (default: one
+    per CPU). With incremental=True a manifest in the output directory records
+    each input's size, mtime and content hash; inputs whose size and mtime are
+    unchanged are skipped without being read, and touched-but-identical ones
+    after a hash check.
     """
     # Ensure the output directory exists
     os.makedirs(output_dir, exist_ok=True)
+    sink = ShardedSink(os.path.join(output_dir, 'shards'), 'cleaned') if output_format == 'jsonl' else None
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = _load_manifest(manifest_path) if incremental else {}
 
-    # Process each JSON file in the input directory
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith('.json'):
-            input_path = os.path.join(input_dir, filename)
-            with open(input_path, 'r', encoding='utf-8') as infile:
-                try:
-                    data = json.load(infile)
-                except json.JSONDecodeError as e:
-                    print(f"Skipping {filename}: invalid JSON ({e})")
-                    continue
+    def output_exists(filename):
+        if sink is not None:
+            return filename in sink
+        return os.path.exists(os.path.join(output_dir, filename))
 
-            # Remove 'annotation' field from each entry
-            cleaned_data = [
-                {
-                    'role': entry.get('role'),
-                    'content': entry.get('content')
-                }
-                for entry in data if isinstance(entry, dict)
-            ]
+    # Decide which inputs need work from their size and mtime alone
+    todo, unchanged = [], 0
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.lower().endswith('.json'):
+            continue
+        stat = os.stat(os.path.join(input_dir, filename))
+        known = manifest.get(filename)
+        if known and known.get('format') != output_format:
+            known = None
+        if known and not output_exists(filename):
+            known = None
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            unchanged += 1
+            continue
+        todo.append((filename, stat, known['sha256'] if known else None))
 
-            # Write the cleaned data to the output directory
-            output_path = os.path.join(output_dir, filename)
-            with open(output_path, 'w', encoding='utf-8') as outfile:
-                json.dump(cleaned_data, outfile, ensure_ascii=False, indent=2)
+    cleaned = invalid = 0
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_process_file, os.path.join(input_dir, filename),
+                                os.path.join(output_dir, filename), known_sha256,
+                                os.path.join(output_dir, filename + '.line.tmp') if sink is not None else None):
+                    (filename, stat)
+                for filename, stat, known_sha256 in todo
+            }
+            for future in concurrent.futures.as_completed(futures):
+                filename, stat = futures[future]
+                status, sha256, payload = future.result()
+                if status == "invalid":
+                    print(f"Skipping {filename}: invalid JSON ({payload})")
+                    invalid += 1
+                    continue
+                if status == "unchanged":
+                    unchanged += 1
+                else:
+                    if sink is not None:
+                        line_path = os.path.join(output_dir, filename + '.line.tmp')
+                        sink.append_line_file(filename, line_path)
+                        os.remove(line_path)
+                    cleaned += 1
+                manifest[filename] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': sha256,
+                    'format': output_format,
+                }
+    finally:
+        if sink is not None:
+            sink.close()
+        if incremental:
+            write_json_atomic(manifest_path, manifest, ensure_ascii=False, indent=2)
 
-    print(f"Processed JSON files from '{input_dir}' and saved results to '{output_dir}'.")
+    print(f"Processed JSON files from '{input_dir}' and saved results to '{output_dir}'. "
+          f"({cleaned} cleaned, {unchanged} unchanged, {invalid} invalid)")
 
 if __name__ == "__main__":
     remove_annotations()
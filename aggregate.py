@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Corpus-level statistics over evaluation.py outputs.
+
+Loads every scored turn from the results directory in one pass. That is
+either the <name>_evaluations.json files or the "evaluations" JSONL sink under
+results/shards. The turns go into one turn × dimension float array. From it
+the report computes, per dimension and for the overall turn score:
+
+    mean and variance over turns,
+    a bootstrap confidence interval of the mean,
+    the same per modality (cbt / sfbt / humanistic),
+    and pairwise modality differences with bootstrap intervals.
+
+The bootstrap resamples whole conversations, not turns, because turns of one
+conversation are not independent. Each replicate is a multinomial weighting of
+the per-conversation sums, so all replicates come out of one matrix product.
+
+The loaded arrays and the finished report are cached under
+<results>/.aggregate_cache, keyed by a hash of the input files' names, sizes
+and mtimes. Re-running on unchanged results reads one .npz file.
+
+    python aggregate.py [results_dir] [--bootstrap 2000] [--confidence 0.95] [--seed 0]
+
+Needs numpy (pip install numpy).
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed here
+    np = None
+
+from checkpoint import write_json_atomic
+from result_sink import ShardedSink, loads
+from scores import DIMENSIONS
+
+CACHE_DIR_NAME = '.aggregate_cache'
+REPORT_NAME = 'aggregate_report.json'
+COLUMNS = DIMENSIONS + ("overall",)
+_CACHE_VERSION = 1
+_MODALITY_TAG = re.compile(r"_(cbt|sfbt|humanistic)(?=_|$)")
+
+
+def _evaluation_files(results_dir):
+    return sorted(glob.glob(os.path.join(results_dir, "*_evaluations.json")))
+
+
+def _sink_shards(results_dir):
+    return sorted(glob.glob(os.path.join(results_dir, "shards", "evaluations-*.jsonl")))
+
+
+def input_fingerprint(results_dir):
+    """Hash of the names, sizes and mtimes of every evaluation output (contents are not read)."""
+    digest = hashlib.sha256(f"v{_CACHE_VERSION}".encode())
+    for path in _evaluation_files(results_dir) + _sink_shards(results_dir):
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, results_dir)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:20]
+
+
+def _modality_from_name(name):
+    match = _MODALITY_TAG.search(os.path.splitext(name)[0].replace("_results", ""))
+    return match.group(1) if match else "unknown"
+
+
+def _conversations(results_dir):
+    """Yield (name, modality, per_turn records) for every evaluated conversation."""
+    for path in _evaluation_files(results_dir):
+        name = os.path.basename(path)[:-len("_evaluations.json")]
+        with open(path, 'rb') as f:
+            per_turn = loads(f.read())
+        modality = None
+        summary_path = path[:-len("_evaluations.json")] + "_summary.json"
+        if os.path.exists(summary_path):
+            with open(summary_path, 'rb') as f:
+                modality = loads(f.read()).get("modality")
+        yield name, modality or _modality_from_name(name), per_turn
+
+    if _sink_shards(results_dir):
+        latest = {}
+        for record_id, record in ShardedSink(os.path.join(results_dir, "shards"), "evaluations").records():
+            latest[record_id] = record          # later records with the same id win
+        for record_id, record in sorted(latest.items()):
+            modality = (record.get("summary") or {}).get("modality")
+            yield record_id, modality or _modality_from_name(record_id), record.get("evaluations") or []
+
+
+class ScoreTable:
+    """
+    Columnar scores: `scores` is float64[turns, 8] (seven dimensions plus the
+    turn average), `conversation` maps each turn to a row of `names`, and
+    `modality` holds a code into `modalities` for each conversation.
+    """
+
+    def __init__(self, scores, conversation, names, modality, modalities):
+        self.scores = scores
+        self.conversation = conversation
+        self.names = names
+        self.modality = modality
+        self.modalities = modalities
+
+    @classmethod
+    def load(cls, results_dir):
+        flat, turn_counts, names, modality_codes, modalities = [], [], [], [], {}
+        for name, modality, per_turn in _conversations(results_dir):
+            rows = [pt["scores"] for pt in per_turn if len(pt.get("scores") or ()) == len(DIMENSIONS)]
+            if not rows:
+                continue
+            for row in rows:
+                flat.extend(row)
+            turn_counts.append(len(rows))
+            names.append(name)
+            modality_codes.append(modalities.setdefault(modality, len(modalities)))
+        dims = np.array(flat, dtype=np.float64).reshape(-1, len(DIMENSIONS))
+        scores = np.hstack([dims, dims.mean(axis=1, keepdims=True)])
+        conversation = np.repeat(np.arange(len(names), dtype=np.int32), turn_counts)
+        return cls(scores, conversation, np.array(names, dtype=str),
+                   np.array(modality_codes, dtype=np.int16), np.array(list(modalities), dtype=str))
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, scores=self.scores, conversation=self.conversation, names=self.names,
+                 modality=self.modality, modalities=self.modalities)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["scores"], data["conversation"], data["names"], data["modality"], data["modalities"])
+
+    def subset(self, modality):
+        """Turns of the conversations with this modality, renumbered from 0."""
+        code = list(self.modalities).index(modality)
+        keep = self.modality == code
+        turn_mask = keep[self.conversation]
+        renumber = np.cumsum(keep) - 1
+        return ScoreTable(self.scores[turn_mask], renumber[self.conversation[turn_mask]].astype(np.int32),
+                          self.names[keep], self.modality[keep], self.modalities)
+
+
+def bootstrap_means(table, n_boot, rng, chunk=100):
+    """float[n_boot, 8] column means of conversation-level bootstrap resamples."""
+    n_conv = len(table.names)
+    sums = np.zeros((n_conv, table.scores.shape[1]))
+    np.add.at(sums, table.conversation, table.scores)
+    counts = np.bincount(table.conversation, minlength=n_conv).astype(np.float64)
+    uniform = np.full(n_conv, 1.0 / n_conv)
+    means = np.empty((n_boot, table.scores.shape[1]))
+    for start in range(0, n_boot, chunk):
+        weights = rng.multinomial(n_conv, uniform, size=min(chunk, n_boot - start)).astype(np.float64)
+        means[start:start + len(weights)] = (weights @ sums) / (weights @ counts)[:, None]
+    return means
+
+
+def _interval(samples, confidence):
+    tail = (1.0 - confidence) / 2 * 100
+    return np.percentile(samples, [tail, 100 - tail], axis=0)
+
+
+def describe(table, n_boot, confidence, rng):
+    """({column: mean, variance, ci}, bootstrap means) for one table."""
+    boot = bootstrap_means(table, n_boot, rng)
+    lows, highs = _interval(boot, confidence)
+    means = table.scores.mean(axis=0)
+    variances = table.scores.var(axis=0, ddof=1) if len(table.scores) > 1 else np.zeros(len(COLUMNS))
+    stats = {
+        column: {"mean": round(float(means[i]), 4), "variance": round(float(variances[i]), 4),
+                 "ci": [round(float(lows[i]), 4), round(float(highs[i]), 4)]}
+        for i, column in enumerate(COLUMNS)
+    }
+    return stats, boot
+
+
+def build_report(table, n_boot=2000, confidence=0.95, seed=0):
+    rng = np.random.default_rng(seed)
+    overall, _ = describe(table, n_boot, confidence, rng)
+    report = {
+        "conversations": int(len(table.names)),
+        "turns": int(len(table.scores)),
+        "bootstrap": n_boot,
+        "confidence": confidence,
+        "overall": overall,
+        "by_modality": {},
+        "comparisons": [],
+    }
+    boots = {}
+    for modality in sorted(table.modalities):
+        sub = table.subset(modality)
+        stats, boots[modality] = describe(sub, n_boot, confidence, rng)
+        report["by_modality"][modality] = {"conversations": int(len(sub.names)), "turns": int(len(sub.scores)),
+                                           "columns": stats}
+
+    names = sorted(boots)
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            diff_boot = boots[a] - boots[b]
+            lows, highs = _interval(diff_boot, confidence)
+            for k, column in enumerate(COLUMNS):
+                diff = (report["by_modality"][a]["columns"][column]["mean"]
+                        - report["by_modality"][b]["columns"][column]["mean"])
+                report["comparisons"].append({
+                    "a": a, "b": b, "column": column, "difference": round(diff, 4),
+                    "ci": [round(float(lows[k]), 4), round(float(highs[k]), 4)],
+                    "significant": bool(lows[k] > 0 or highs[k] < 0),
+                })
+    return report
+
+
+def aggregate(results_dir='./results', n_boot=2000, confidence=0.95, seed=0, use_cache=True):
+    """The corpus report for results_dir (from the cache when the inputs are unchanged)."""
+    if np is None:
+        raise SystemExit("aggregate.py needs numpy: pip install numpy")
+    cache_dir = os.path.join(results_dir, CACHE_DIR_NAME)
+    fingerprint = input_fingerprint(results_dir)
+    table_path = os.path.join(cache_dir, f"{fingerprint}.npz")
+    report_path = os.path.join(cache_dir, f"{fingerprint}-{n_boot}-{confidence}-{seed}.json")
+    if use_cache and os.path.exists(report_path):
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    if use_cache and os.path.exists(table_path):
+        table = ScoreTable.open(table_path)
+    else:
+        table = ScoreTable.load(results_dir)
+        if use_cache:
+            os.makedirs(cache_dir, exist_ok=True)
+            table.save(table_path)
+    if not len(table.scores):
+        return None
+    report = build_report(table, n_boot, confidence, seed)
+    report["fingerprint"] = fingerprint
+    if use_cache:
+        write_json_atomic(report_path, report, ensure_ascii=False, indent=2)
+    return report
+
+
+def format_report(report):
+    modalities = sorted(report["by_modality"])
+    lines = [f"{report['conversations']:,} conversations, {report['turns']:,} scored turns "
+             f"({report['confidence']:.0%} bootstrap intervals, {report['bootstrap']} resamples of conversations)",
+             "",
+             f"{'dimension':<30}{'all':>22}" + "".join(f"{m:>22}" for m in modalities)]
+
+    def cell(stats):
+        return f"{stats['mean']:.2f} [{stats['ci'][0]:.2f}, {stats['ci'][1]:.2f}]"
+
+    for column in COLUMNS:
+        row = f"{column:<30}{cell(report['overall'][column]):>22}"
+        row += "".join(f"{cell(report['by_modality'][m]['columns'][column]):>22}" for m in modalities)
+        lines.append(row)
+    if report["comparisons"]:
+        lines += ["", "Modality differences (a - b) that exclude zero:"]
+        shown = [c for c in report["comparisons"] if c["significant"]]
+        for c in shown:
+            pair = f"{c['a']} - {c['b']}"
+            lines.append(f"  {pair:<22}{c['column']:<30} {c['difference']:+.3f} "
+                         f"[{c['ci'][0]:+.3f}, {c['ci'][1]:+.3f}]")
+        if not shown:
+            lines.append("  (none)")
+    return "\n".join(lines)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate evaluation results across the corpus.")
+    parser.add_argument("results_dir", nargs="?", default="./results")
+    parser.add_argument("--bootstrap", type=int, default=2000, help="bootstrap resamples")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cache", action="store_true", help="ignore and do not write the cache")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    start = time.perf_counter()
+    report = aggregate(args.results_dir, args.bootstrap, args.confidence, args.seed, use_cache=not args.no_cache)
+    if report is None:
+        print(f"No scored turns found in {args.results_dir}")
+    else:
+        write_json_atomic(os.path.join(args.results_dir, REPORT_NAME), report, ensure_ascii=False, indent=2)
+        print(format_report(report))
+        print(f"\nReport → {os.path.join(args.results_dir, REPORT_NAME)} ({time.perf_counter() - start:.2f}s)")
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Offline request/response exchange in the chat-completions batch JSONL format.
+
+Request lines:
+    {"custom_id": ..., "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+Result lines:
+    {"id": ..., "custom_id": ..., "response": {"status_code": 200, "body": <chat completion>}, "error": null}
+
+The same files work with the provider's discounted batch endpoint and with
+any high-throughput local server that can replay them. `simulate` is a local
+stand-in that turns a request file into a result file, for end-to-end runs
+without an API key:
+
+    python batch_io.py requests.jsonl results.jsonl
+"""
+import json
+import re
+import sys
+import uuid
+
+from scores import DIMENSIONS
+from tokens import count_message_tokens, count_tokens
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+
+def write_requests(path, requests):
+    """Write (custom_id, body) pairs to `path`; returns how many were written."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, body in requests:
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": CHAT_COMPLETIONS_URL,
+                "body": body,
+            }, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_requests(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_results(path):
+    """Map custom_id -> reply text (None for requests that failed)."""
+    results = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            content = None
+            if not record.get("error") and response.get("status_code") == 200:
+                choices = response.get("body", {}).get("choices") or []
+                if choices:
+                    content = choices[0]["message"]["content"]
+            results[record["custom_id"]] = content
+    return results
+
+
+def completion_body(model, content, messages):
+    """A chat-completion response body with usage filled in from local token counts."""
+    prompt_tokens = count_message_tokens(messages, model)
+    completion_tokens = count_tokens(content, model)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+CANNED_THERAPIST_REPLIES = [
+    "听起来这段时间你真的承受了很多，愿意和我多说说最让你难受的是哪一部分吗？",
+    "谢谢你愿意把这些说出来，这本身就需要勇气 🌱 你觉得是什么让你一直坚持到现在？",
+    "我注意到你提到自己总是担心别人的看法，这种想法通常在什么时候最强烈？",
+    "你已经在尝试用不同的方式照顾自己了，这一点很重要。接下来你最想先改变哪一小步？",
+]
+CANNED_CLIENT_REPLIES = [
+    "嗯……我也不知道，就是最近总觉得很累，好像做什么都提不起劲。",
+    "其实我试过，但是每次一想到要跟别人说，我就很紧张，最后还是算了。",
+    "你这么说我好像有点明白了，不过我还是担心自己做不到。",
+    "可能吧……我以前没这么想过，感觉有点乱。",
+]
+
+
+def canned_reply(body):
+    """Placeholder reply for a request body: scores for rubric prompts, a plausible turn otherwise."""
+    messages = body.get("messages") or [{"role": "user", "content": ""}]
+    first = messages[0]["content"]
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("name")
+    if schema == "recovered_scores":
+        return json.dumps({"found_all_seven": True, "scores": dict(zip(DIMENSIONS, [2] * 7))})
+    if "Evaluation Expert" in first:
+        if response_format.get("type") in ("json_object", "json_schema") and schema != "turn_scores":
+            indices = re.findall(r"utterance index (\d+):", messages[-1]["content"])
+            scores = dict(zip(DIMENSIONS, [2] * 7)) if schema else [2] * 7
+            return json.dumps({"scores": [{"utterance_index": int(i), "scores": scores} for i in indices]})
+        if schema == "turn_scores":
+            return json.dumps(dict(zip(DIMENSIONS, [2] * 7)))
+        return "2 2 2 2 2 2 2"
+    if "Note-taker" in first:
+        return "来访者谈到持续的压力和疲惫，咨询师在帮助其识别想法并寻找可行的小步骤。"
+    replies = CANNED_THERAPIST_REPLIES if "Therapist Instructions" in first else CANNED_CLIENT_REPLIES
+    # Deterministic per request, so cached and uncached runs see the same text.
+    return replies[sum(len(m["content"]) for m in messages) % len(replies)]
+
+
+def simulate(requests_path, results_path, respond=canned_reply):
+    """Local stand-in for a batch endpoint: answer every request with `respond(body)`."""
+    with open(results_path, 'w', encoding='utf-8') as out:
+        for request in read_requests(requests_path):
+            body = request["body"]
+            out.write(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": completion_body(body["model"], respond(body), body["messages"]),
+                },
+                "error": None,
+            }, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    simulate(sys.argv[1], sys.argv[2])
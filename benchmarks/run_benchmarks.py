@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the generation and evaluation pipelines
+------------------------------------------------------
+• Micro: prompt assembly (flat build_full_prompt vs. the job's rolling
+  context), client prompt / seed encodings, and the JSON load/dump paths,
+  over growing turn counts and corpus sizes
+• Macro: full GenerateConv and evaluation runs against fake_server.py in a
+  scratch directory — conversations per minute, scored turns per minute and
+  input tokens per call
+• Results go to benchmarks/latest.json and are compared with
+  benchmarks/baseline.json. Token counts are deterministic (canned replies,
+  local token counting) and get a tight tolerance; timings get a loose one.
+  Growth exponents are checked on their own, so a change that makes prompt
+  building or per-turn input tokens quadratic fails even without a baseline.
+
+Usage:
+    python benchmarks/run_benchmarks.py                    # run and compare
+    python benchmarks/run_benchmarks.py --update-baseline  # accept current numbers
+    python benchmarks/run_benchmarks.py --micro-only
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)  # the pipelines are top-level scripts, not a package
+
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+LATEST_PATH = os.path.join(HERE, "latest.json")
+
+TURN_COUNTS = (10, 20, 40, 80)
+CORPUS_SIZES = (100, 1000)
+TIME_TOLERANCE = 0.5        # timings may drift ±50% between runs/machines
+COUNT_TOLERANCE = 0.10      # token counts are deterministic; allow 10%
+MAX_GROWTH_EXPONENT = 1.5   # anything above this is treated as quadratic
+
+SAMPLE_SENTENCES = [
+    "我最近总是睡不好，脑子里一直在想工作上的事情。",
+    "听起来这段时间你承受了很多压力，愿意多说说吗？",
+    "I keep telling myself it's fine, but it doesn't feel fine.",
+    "你已经在努力照顾自己了，这一点很重要 🌱",
+]
+
+
+def synthetic_conversation(n_turns, therapist_role="therapist_Humanistic", seed=0):
+    rng = random.Random(seed)
+    convo = []
+    for i in range(n_turns):
+        role = "client" if i % 2 == 0 else therapist_role
+        convo.append({"role": role, "content": " ".join(rng.choices(SAMPLE_SENTENCES, k=3))})
+    return convo
+
+
+@contextlib.contextmanager
+def in_directory(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def best_time(fn, repeat=5, number=1):
+    return min(timeit.repeat(fn, repeat=repeat, number=number)) / number
+
+
+def growth_exponent(xs, ys):
+    """Least-squares slope of log(y) against log(x): 1 is linear, 2 quadratic."""
+    lx = [math.log(x) for x in xs]
+    ly = [math.log(max(y, 1e-12)) for y in ys]
+    mx, my = sum(lx) / len(lx), sum(ly) / len(ly)
+    return sum((a - mx) * (b - my) for a, b in zip(lx, ly)) / sum((a - mx) ** 2 for a in lx)
+
+
+# ───────────────────────────────────────────────────────────────
+# Micro-benchmarks
+# ───────────────────────────────────────────────────────────────
+def micro_prompt_assembly(gc, metrics):
+    from context import RollingContext
+    from tokens import count_tokens
+
+    flat_times, rolling_times, rolling_tokens = [], [], []
+    for n in TURN_COUNTS:
+        convo = synthetic_conversation(n)
+
+        def flat():
+            for k in range(1, n):
+                gc.build_full_prompt("client", convo[:k], "C", "T")
+
+        def rolling():
+            ctx = RollingContext(gc.CONTEXT_TOKEN_BUDGET, gc.CONTEXT_KEEP_TURNS, gc.MODEL_NAME)
+            for msg in convo:
+                ctx.append(msg)
+                if ctx.needs_fold():
+                    ctx.apply_summary("summary", ctx.fold_point())
+                ctx.render()
+
+        flat_times.append(best_time(flat))
+        rolling_times.append(best_time(rolling))
+        ctx = RollingContext(gc.CONTEXT_TOKEN_BUDGET, gc.CONTEXT_KEEP_TURNS, gc.MODEL_NAME)
+        for msg in convo:
+            ctx.append(msg)
+            if ctx.needs_fold():
+                ctx.apply_summary("summary", ctx.fold_point())
+        rolling_tokens.append(count_tokens(ctx.render(), gc.MODEL_NAME))
+        metrics[f"micro.flat_prompts_{n}_turns_sec"] = (flat_times[-1], "time")
+        metrics[f"micro.rolling_prompts_{n}_turns_sec"] = (rolling_times[-1], "time")
+        metrics[f"micro.rolling_last_prompt_{n}_turns_tokens"] = (rolling_tokens[-1], "count")
+
+    metrics["growth.rolling_prompt_build"] = (growth_exponent(TURN_COUNTS, rolling_times), "growth")
+    # Informational: the legacy flat path is quadratic by construction.
+    metrics["info.flat_prompt_build_exponent"] = (growth_exponent(TURN_COUNTS, flat_times), "info")
+
+
+def micro_client_prompt(gc, metrics):
+    from prompt_budget import compact_seed
+    from tokens import count_tokens
+
+    for n in (10, 40):
+        seed = synthetic_conversation(n, therapist_role="counselor", seed=n)
+        for fmt in ("indent", "json", "text"):
+            text = compact_seed(seed, fmt)
+            metrics[f"micro.seed_{fmt}_{n}_turns_tokens"] = (count_tokens(text, gc.MODEL_NAME), "count")
+        metrics[f"micro.build_client_prompt_{n}_turns_sec"] = (
+            best_time(lambda: gc.build_client_prompt(compact_seed(seed, gc.SEED_FORMAT)), number=20), "time")
+
+
+def micro_json_paths(metrics):
+    for size in CORPUS_SIZES:
+        corpus = [synthetic_conversation(20, seed=i) for i in range(size)]
+        pretty = [json.dumps(c, ensure_ascii=False, indent=2) for c in corpus]
+        metrics[f"micro.json_dump_indent_{size}_sec"] = (
+            best_time(lambda: [json.dumps(c, ensure_ascii=False, indent=2) for c in corpus], repeat=3), "time")
+        metrics[f"micro.json_dump_compact_{size}_sec"] = (
+            best_time(lambda: [json.dumps(c, ensure_ascii=False, separators=(",", ":")) for c in corpus], repeat=3),
+            "time")
+        metrics[f"micro.json_load_{size}_sec"] = (best_time(lambda: [json.loads(p) for p in pretty], repeat=3), "time")
+
+
+# ───────────────────────────────────────────────────────────────
+# Macro-benchmarks (against fake_server.py)
+# ───────────────────────────────────────────────────────────────
+def start_fake_server(latency):
+    import fake_server
+    config = fake_server.parse_args(["--port", "0", "--latency", latency])
+    server = fake_server.make_server(config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake_server.FakeChatHandler.stats
+
+
+def macro_generation(gc, metrics, n_seeds, use_async):
+    from closure import ClosureStats
+    from ratelimit import RateLimiter
+    from usage import UsageStats
+
+    label = "async" if use_async else "threads"
+    with tempfile.TemporaryDirectory() as scratch, in_directory(scratch):
+        os.makedirs("data")
+        for i in range(n_seeds):
+            with open(os.path.join("data", f"seed{i:04d}.json"), "w", encoding="utf-8") as f:
+                json.dump(synthetic_conversation(8, therapist_role="counselor", seed=i), f, ensure_ascii=False)
+        gc.USAGE = UsageStats()
+        gc.LIMITER = RateLimiter()           # measure the pipeline, not the account limits
+        gc.CACHE.mode = "off"
+        # The synthetic seeds share four sentences and the fake server has four
+        # canned replies: seed dedup and the repetition stop would cut the run short.
+        gc.SEED_DEDUP_THRESHOLD = None
+        gc.REPEAT_THRESHOLD = None
+        gc.CLOSURES = ClosureStats()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            gc.main(use_async=use_async, resume=False)
+        elapsed = time.perf_counter() - start
+    finished = sum(gc.CLOSURES.reasons.values())
+    metrics[f"macro.generation_{label}_conversations_per_min"] = (finished / elapsed * 60, "rate")
+    metrics[f"info.generation_{label}_conversations_finished"] = (finished, "info")
+    if gc.USAGE.calls:
+        metrics[f"macro.generation_{label}_input_tokens_per_call"] = (gc.USAGE.prompt_tokens / gc.USAGE.calls, "count")
+
+
+def macro_evaluation(ev, metrics, n_files):
+    from ratelimit import RateLimiter
+    from usage import UsageStats
+
+    with tempfile.TemporaryDirectory() as scratch, in_directory(scratch):
+        os.makedirs("data")
+        for i in range(n_files):
+            with open(os.path.join("data", f"conv{i:04d}.json"), "w", encoding="utf-8") as f:
+                json.dump(synthetic_conversation(20, therapist_role="therapist_cbt_prompt", seed=i), f,
+                          ensure_ascii=False)
+        ev.USAGE = UsageStats()
+        ev.LIMITER = RateLimiter()
+        ev.CACHE.mode = "off"
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ev.main()
+        elapsed = time.perf_counter() - start
+    metrics["macro.evaluation_turns_per_min"] = (n_files * 10 / elapsed * 60, "rate")
+    if ev.USAGE.calls:
+        metrics["macro.evaluation_input_tokens_per_turn"] = (ev.USAGE.prompt_tokens / (n_files * 10), "count")
+
+
+def macro_generation_growth(gc, metrics):
+    """Input tokens of a whole conversation as num_turns grows (linear with a bounded context)."""
+    from tokens import count_message_tokens, count_tokens
+
+    per_call = []
+    with tempfile.TemporaryDirectory() as scratch, in_directory(scratch):
+        os.makedirs("data")
+        seed_path = os.path.join("data", "seed.json")
+        with open(seed_path, "w", encoding="utf-8") as f:
+            json.dump(synthetic_conversation(8, therapist_role="counselor"), f, ensure_ascii=False)
+        for n in TURN_COUNTS:
+            job = gc.ConversationJob(seed_path, "cbt", num_turns=n)
+            total, calls = 0, 0
+            rng = random.Random(n)
+            while not job.done:
+                prompt = job.next_prompt()
+                total += count_tokens(prompt) if isinstance(prompt, str) else count_message_tokens(prompt)
+                calls += 1
+                job.add_reply(" ".join(rng.choices(SAMPLE_SENTENCES, k=3)))
+            per_call.append(total / calls)
+            metrics[f"macro.generation_{n}_turns_input_tokens_per_call"] = (per_call[-1], "count")
+    metrics["growth.generation_total_input_tokens"] = (growth_exponent(TURN_COUNTS, per_call) + 1, "growth")
+
+
+# ───────────────────────────────────────────────────────────────
+# Baseline comparison
+# ───────────────────────────────────────────────────────────────
+def compare(metrics, baseline):
+    failures = []
+    for name, (value, kind) in sorted(metrics.items()):
+        if kind == "growth":
+            if value > MAX_GROWTH_EXPONENT:
+                failures.append(f"{name}: growth exponent {value:.2f} > {MAX_GROWTH_EXPONENT}")
+            continue
+        base = baseline.get(name, {}).get("value")
+        if base is None or kind == "info":
+            continue
+        if kind == "time" and value > base * (1 + TIME_TOLERANCE):
+            failures.append(f"{name}: {value:.4g}s vs baseline {base:.4g}s")
+        elif kind == "rate" and value < base * (1 - TIME_TOLERANCE):
+            failures.append(f"{name}: {value:.4g}/min vs baseline {base:.4g}/min")
+        elif kind == "count" and value > base * (1 + COUNT_TOLERANCE):
+            failures.append(f"{name}: {value:.4g} vs baseline {base:.4g}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--micro-only", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--seeds", type=int, default=20, help="seed files in the generation macro-benchmark")
+    parser.add_argument("--latency", default="const:0.02", help="fake server latency distribution")
+    args = parser.parse_args(argv)
+
+    metrics = {}
+    server = None
+    if not args.micro_only:
+        # The pipelines read OPENAI_BASE_URL at import time, so start the server first.
+        server, server_stats = start_fake_server(args.latency)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    import GenerateConv as gc
+    import evaluation as ev
+
+    micro_prompt_assembly(gc, metrics)
+    micro_client_prompt(gc, metrics)
+    micro_json_paths(metrics)
+    macro_generation_growth(gc, metrics)
+    if server is not None:
+        macro_generation(gc, metrics, args.seeds, use_async=True)
+        macro_generation(gc, metrics, args.seeds, use_async=False)
+        macro_evaluation(ev, metrics, max(1, args.seeds // 2))
+        metrics["info.fake_server_peak_in_flight"] = (server_stats.peak_in_flight, "info")
+        server.shutdown()
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "metrics": {name: {"value": round(value, 6), "kind": kind} for name, (value, kind) in sorted(metrics.items())},
+    }
+    with open(LATEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for name, entry in report["metrics"].items():
+        print(f"{name:<58} {entry['value']:>14.6g}  {entry['kind']}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline updated → {BASELINE_PATH}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            baseline = json.load(f)["metrics"]
+    else:
+        print("\nNo baseline yet; run with --update-baseline to record one.")
+    failures = compare(metrics, baseline)
+    for failure in failures:
+        print(f"REGRESSION  {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Escalation rules and tier agreement for the two-tier (cascade) evaluator.
+
+The cheap model scores every turn, possibly several times at a non-zero
+temperature. `escalation_reason` decides from those samples whether the
+expensive model should score the turn as well:
+
+    "parse"        a cheap answer needed a re-ask or could not be read at all
+    "disagreement" two cheap samples differ by more than max_spread on a dimension
+    "borderline"   a dimension's cheap mean lies within margin of a threshold
+                   and either falls below it, or falls strictly between two
+                   rubric steps (the samples straddled it): the tiers could
+                   easily disagree about whether the turn meets that level.
+                   A mean exactly on a step at or above the threshold means
+                   the samples agreed there, and is not escalated.
+
+Turns without a reason keep the cheap scores. A small random share of them
+is audited by the expensive model anyway. For every turn scored by both
+tiers, CascadeStats records whether the two agree, i.e. every dimension is
+within `tolerance`. It keeps escalated and audited turns apart: agreement
+on escalated turns is low by construction, while agreement on audited turns
+estimates how often the cheap tier alone is right.
+"""
+import threading
+
+
+def sample_mean(samples):
+    """Per-dimension mean of several seven-score samples."""
+    return [sum(column) / len(column) for column in zip(*samples)]
+
+
+def _between_steps(value, step):
+    return abs(value / step - round(value / step)) > 1e-9
+
+
+def escalation_reason(samples, parse_trouble=False, thresholds=(2.0,), margin=0.5, max_spread=0.5, step=0.5):
+    """Why a turn should go to the expensive model ("parse", "disagreement", "borderline"), or None."""
+    if parse_trouble or not samples:
+        return "parse"
+    if any(max(column) - min(column) > max_spread for column in zip(*samples)):
+        return "disagreement"
+    if any(abs(t - m) <= margin and (m < t or _between_steps(m, step))
+           for m in sample_mean(samples) for t in thresholds):
+        return "borderline"
+    return None
+
+
+def agree(cheap, expensive, tolerance=0.5):
+    return all(abs(a - b) <= tolerance for a, b in zip(cheap, expensive))
+
+
+class CascadeStats:
+    """Turns kept at the cheap tier, escalations by reason, and tier agreement where both scored."""
+
+    def __init__(self, tolerance=0.5):
+        self.tolerance = tolerance
+        self.turns = 0
+        self.escalated = {}
+        self.compared = {"escalated": [0, 0], "audited": [0, 0]}   # [turns, agreeing]
+        self.abs_diff = [0.0] * 7
+        self._lock = threading.Lock()
+
+    def record(self, reason=None):
+        """One turn through the cascade; `reason` is set if it was escalated."""
+        with self._lock:
+            self.turns += 1
+            if reason:
+                self.escalated[reason] = self.escalated.get(reason, 0) + 1
+
+    def compare(self, kind, cheap, expensive):
+        """Both tiers scored the turn; `kind` is "escalated" or "audited"."""
+        with self._lock:
+            counts = self.compared[kind]
+            counts[0] += 1
+            counts[1] += agree(cheap, expensive, self.tolerance)
+            self.abs_diff = [d + abs(a - b) for d, a, b in zip(self.abs_diff, cheap, expensive)]
+
+    def agreement(self, kind=None):
+        """Share of compared turns (of one kind, or all) where the tiers agree; None if none compared."""
+        kinds = [kind] if kind else list(self.compared)
+        total = sum(self.compared[k][0] for k in kinds)
+        return sum(self.compared[k][1] for k in kinds) / total if total else None
+
+    def as_dict(self):
+        compared = sum(n for n, _ in self.compared.values())
+        return {
+            "turns": self.turns,
+            "escalated": dict(self.escalated),
+            "escalation_rate": round(sum(self.escalated.values()) / self.turns, 4) if self.turns else None,
+            "compared": {k: n for k, (n, _) in self.compared.items()},
+            "agreement": {k: None if self.agreement(k) is None else round(self.agreement(k), 4)
+                          for k in self.compared},
+            "mean_abs_diff": [round(d / compared, 4) for d in self.abs_diff] if compared else None,
+            "tolerance": self.tolerance,
+        }
+
+    def summary(self):
+        if not self.turns:
+            return "cascade not used"
+        escalated = sum(self.escalated.values())
+        reasons = ", ".join(f"{k} {v}" for k, v in sorted(self.escalated.items())) or "none"
+        line = f"{escalated}/{self.turns} turns escalated ({escalated / self.turns:.1%}; {reasons})"
+        for kind, (n, agreeing) in self.compared.items():
+            if n:
+                line += f" | {kind} tier agreement {agreeing / n:.1%} of {n}"
+        return line + f" (all dimensions within ±{self.tolerance})"
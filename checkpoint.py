@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Crash-safe persistence helpers.
+
+Each in-progress conversation gets an append-only JSONL journal with one line
+per completed turn, flushed and fsync'ed before the next call is made. A torn
+final line (from a kill mid-write) is cut off on read, so a journal always
+replays to the last fully recorded turn and later appends start cleanly. Final outputs are written to a
+temporary file and renamed into place, so a finished file is never partial.
+"""
+import json
+import os
+
+CHECKPOINT_DIR = './results/checkpoints'
+
+
+def journal_path(file_path, checkpoint_dir=CHECKPOINT_DIR):
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(checkpoint_dir, base_name + ".jsonl")
+
+
+def append_records(path, records, truncate=False):
+    """Append several records with one open and one fsync."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w' if truncate else 'a', encoding='utf-8') as jf:
+        jf.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        jf.flush()
+        os.fsync(jf.fileno())
+
+
+def append_record(path, record, truncate=False):
+    append_records(path, [record], truncate=truncate)
+
+
+def read_journal(path):
+    """
+    Return every complete record in the journal (empty list if there is none).
+    A torn or unreadable tail is cut off the file, so records appended by the
+    resumed run start on a fresh line and are read back next time.
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    good = 0  # byte offset just past the last complete record
+    with open(path, 'rb') as jf:
+        for line in jf:
+            if not line.endswith(b"\n"):
+                break  # torn write from an interrupted run
+            try:
+                records.append(json.loads(line))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                break
+            good += len(line)
+    if good < os.path.getsize(path):
+        with open(path, 'r+b') as jf:
+            jf.truncate(good)
+            jf.flush()
+            os.fsync(jf.fileno())
+    return records
+
+
+def write_json_atomic(path, data, **dump_kwargs):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_kwargs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Detects when a generated conversation has come to a natural close.
+
+The therapist prompts ask the model to wrap up "when it feels complete"; after
+that, further turns are pleasantries we pay for and then throw away. The local
+heuristic looks for a farewell in the last two turns answered by a farewell or
+thanks from the other side. Only unambiguous goodbyes ("再见", "拜拜") close a
+conversation outright. Phrases that also occur mid-session ("take care",
+"保重"), a one-sided goodbye, or mutual thanks give "maybe", and a small
+classifier model can settle it (CLOSURE_PROMPT). English phrases match whole
+words, Chinese goodbyes only when they stand alone, and a turn that ends in
+a question never counts as a farewell.
+"""
+import re
+import threading
+
+# Unambiguous goodbyes: an exchange of these closes the conversation outright.
+# Each must stand alone (at most a particle, then punctuation or the end), so
+# "下次见面我们继续" or "不想再见到他" do not count.
+_GOODBYE_END = r"(?=[啦了哦呀喽吧啊]?(?:[\s。！!，,~～….、]|$))"
+FAREWELL_PATTERN = re.compile(rf"(?:再见|拜拜|下次见|下次再聊){_GOODBYE_END}")
+# Phrases that also occur mid-session ("take care", "保重身体"): they only make
+# a close likely, and the classifier (if configured) decides.
+SOFT_FAREWELL_MARKERS = ("保重", "一路顺利", "祝你一切")
+SOFT_FAREWELL_PATTERN = re.compile(r"\b(?:good-?bye|bye|take care(?! of)|see you)\b")
+THANKS_MARKERS = ("谢谢", "感谢", "多谢")
+THANKS_PATTERN = re.compile(r"\bthank(?:s|\s+you)\b")
+
+CLOSURE_PROMPT = """
+# Role: Conversation Closure Check
+
+Below are the last turns of a counseling conversation. Has the conversation
+reached a natural close (both sides have said goodbye or wrapped up, and
+anything further would only be pleasantries)? Answer with exactly YES or NO.
+
+{turns}
+"""
+
+
+def _farewell(text):
+    """"firm", "soft" or None; a turn that ends in a question is still talking, not leaving."""
+    text = text.strip().lower()
+    if text.endswith(("?", "？")):
+        return None
+    if FAREWELL_PATTERN.search(text):
+        return "firm"
+    if any(marker in text for marker in SOFT_FAREWELL_MARKERS) or SOFT_FAREWELL_PATTERN.search(text):
+        return "soft"
+    return None
+
+
+def _thanks(text):
+    text = text.lower()
+    return any(marker in text for marker in THANKS_MARKERS) or bool(THANKS_PATTERN.search(text))
+
+
+def detect_closure(conversation):
+    """
+    ("closed", reason), ("maybe", reason) or (None, None) for the end of
+    `conversation`, a list of {"role", "content"} turns. Only an exchange of
+    unambiguous goodbyes is "closed"; softer phrases give "maybe".
+    """
+    if len(conversation) < 2:
+        return None, None
+    earlier, last = conversation[-2]["content"], conversation[-1]["content"]
+    bye_earlier, bye_last = _farewell(earlier), _farewell(last)
+    thanks_earlier, thanks_last = _thanks(earlier), _thanks(last)
+    if (bye_earlier and (bye_last or thanks_last)) or (bye_last and thanks_earlier):
+        if "soft" in (bye_earlier, bye_last):
+            return "maybe", "farewell phrases exchanged"
+        return "closed", "farewell exchanged"
+    if bye_earlier or bye_last:
+        return "maybe", "one-sided farewell"
+    if thanks_earlier and thanks_last:
+        return "maybe", "mutual thanks"
+    return None, None
+
+
+def closure_prompt(conversation, last_n=4):
+    turns = "\n".join(
+        f"{'Therapist' if 'therapist' in msg['role'] else 'Client'}: {msg['content']}"
+        for msg in conversation[-last_n:]
+    )
+    return CLOSURE_PROMPT.format(turns=turns)
+
+
+def parse_closure_answer(answer):
+    return bool(answer) and answer.strip().upper().startswith("YES")
+
+
+class ClosureStats:
+    """Why conversations stopped, and the turns / input tokens an early stop saved."""
+
+    def __init__(self):
+        self.reasons = {}
+        self.turns_saved = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, reason, turns_saved=0, tokens_saved=0):
+        with self._lock:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            self.turns_saved += turns_saved
+            self.tokens_saved += tokens_saved
+
+    def summary(self):
+        if not self.reasons:
+            return "no conversations finished"
+        reasons = ", ".join(f"{k} {v}" for k, v in sorted(self.reasons.items()))
+        return f"{reasons} | {self.turns_saved:,} turns and ~{self.tokens_saved:,} input tokens saved"
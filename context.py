@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Token-budgeted rolling transcript for generation prompts.
+
+Each turn is rendered and token-counted once, when it is appended. While the
+transcript fits the budget it is sent verbatim, exactly like the original
+flattened prompt. Once it does not, every turn except the last `keep_turns`
+is folded into a running summary; the summary is produced by the model from
+the previous summary plus the newly folded turns, so each turn is summarized
+once and the prompt stays roughly constant in size however long the
+conversation runs.
+"""
+from tokens import count_tokens
+
+SUMMARY_PROMPT = """
+# Role: Note-taker for a psychological counseling session
+
+Update the running summary of the counseling session below so that it also covers the new turns. Keep the client's main concerns, emotions and key disclosures, the therapist's interventions, and any goals, insights or tasks that were agreed. Write plain prose in the same language as the conversation, at most 200 words.
+
+## Current summary
+{summary}
+
+## New turns
+{turns}
+
+Return only the updated summary.
+"""
+
+
+def render_turn(msg):
+    role_label = "Therapist" if "therapist" in msg["role"] else "Client"
+    return f"{role_label}: {msg['content']}"
+
+
+class RollingContext:
+    def __init__(self, token_budget=6000, keep_turns=8, model="gpt-4o-mini"):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.model = model
+        self.summary = ""
+        self.folded = 0          # number of leading turns covered by the summary
+        self._messages = []
+        self._lines = []
+        self._tokens = []
+        self._summary_tokens = 0
+        self._verbatim_tokens = 0
+
+    def append(self, msg):
+        line = render_turn(msg)
+        self._messages.append(msg)
+        self._lines.append(line)
+        self._tokens.append(count_tokens(line, self.model))
+        self._verbatim_tokens += self._tokens[-1]
+
+    @property
+    def tokens(self):
+        return self._summary_tokens + self._verbatim_tokens
+
+    def needs_fold(self):
+        verbatim_turns = len(self._lines) - self.folded
+        return verbatim_turns > self.keep_turns and self.tokens > self.token_budget
+
+    def fold_point(self):
+        """Number of leading turns the summary will cover after the next fold."""
+        return len(self._lines) - self.keep_turns
+
+    def fold_prompt(self):
+        """Prompt asking the model to fold all but the last `keep_turns` turns into the summary."""
+        return SUMMARY_PROMPT.format(
+            summary=self.summary or "(none yet)",
+            turns="\n".join(self._lines[self.folded:self.fold_point()])
+        )
+
+    def apply_summary(self, summary, upto):
+        self.summary = summary.strip()
+        self._summary_tokens = count_tokens(self.summary, self.model)
+        self._verbatim_tokens -= sum(self._tokens[self.folded:upto])
+        self.folded = upto
+
+    def render(self):
+        text = "\n".join(self._lines[self.folded:])
+        if self.summary:
+            text = f"[Summary of the earlier conversation]: {self.summary}\n{text}"
+        return text.strip()
+
+    def chat_messages(self, speaker):
+        """Transcript as chat messages seen by `speaker`: its own turns are 'assistant'."""
+        speaker_is_therapist = "therapist" in speaker
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        for msg in self._messages[self.folded:]:
+            own = ("therapist" in msg["role"]) == speaker_is_therapist
+            messages.append({"role": "assistant" if own else "user", "content": msg["content"]})
+        return messages
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped index over a directory of conversation JSON files.
+
+Built once from the cleaned corpus (SmileChatProcessing output or ./data).
+It lets the pipelines pick seeds by id, sample or length without opening
+every file. Layout, all little-endian:
+
+    header   magic b"CIDX", version u16, padding, count u32
+    offsets  u32[count + 1]   byte offsets of each name in the names blob
+    turns    u32[count]       entries in the conversation
+    chars    u32[count]       total characters of content
+    sizes    u64[count]       file size in bytes when indexed
+    mtimes   u64[count]       file mtime (ns) when indexed
+    names    UTF-8 file names, concatenated, sorted
+
+The columns are read straight off the mmap into `array`s, so opening a
+large index costs one mmap and five memcpys. On load every .json file in
+the directory is stat'ed and the index is rebuilt when a file was added,
+removed, or rewritten (size or mtime changed). The directory mtime alone
+misses files rewritten in place.
+
+    python corpus_index.py build ./data
+    python corpus_index.py select ./data --sample 100 --seed 1 --min-turns 10
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+
+from SmileChatProcessing import iter_json_array
+
+INDEX_NAME = '.corpus_index.bin'
+_HEADER = struct.Struct("<4sHxxI")
+_MAGIC = b"CIDX"
+_VERSION = 2
+
+
+def index_path_for(data_dir):
+    return os.path.join(data_dir, INDEX_NAME)
+
+
+def _le_array(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+def _listing(data_dir):
+    """[(file name, size, mtime_ns)] of the .json files in data_dir, sorted by name."""
+    listing = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith('.json') and not entry.name.startswith('.') and entry.is_file():
+                st = entry.stat()
+                listing.append((entry.name, st.st_size, st.st_mtime_ns))
+    return sorted(listing)
+
+
+def build_index(data_dir, index_path=None):
+    """Scan every .json file in data_dir (streamed) and write the index; returns its path."""
+    index_path = index_path or index_path_for(data_dir)
+    names, turns, chars, sizes, mtimes = [], [], [], [], []
+    for filename, size, mtime in _listing(data_dir):
+        n_turns = n_chars = 0
+        try:
+            with open(os.path.join(data_dir, filename), 'r', encoding='utf-8') as f:
+                for entry in iter_json_array(f):
+                    if isinstance(entry, dict):
+                        n_turns += 1
+                        n_chars += len(entry.get('content') or '')
+        except json.JSONDecodeError as e:
+            print(f"Indexing {filename} as empty: invalid JSON ({e})")
+            n_turns = n_chars = 0
+        names.append(filename.encode('utf-8'))
+        turns.append(n_turns)
+        chars.append(n_chars)
+        sizes.append(size)
+        mtimes.append(mtime)
+
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(names)))
+        for column in (offsets, turns, chars):
+            f.write(_le_array("I", column).tobytes())
+        for column in (sizes, mtimes):
+            f.write(_le_array("Q", column).tobytes())
+        f.write(b"".join(names))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+class CorpusIndex:
+    def __init__(self, index_path):
+        self.path = index_path
+        with open(index_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{index_path} is not a version {_VERSION} corpus index")
+        self.count = count
+        pos = _HEADER.size
+        self._offsets = self._column(pos, count + 1)
+        pos += 4 * (count + 1)
+        self.turns = self._column(pos, count)
+        pos += 4 * count
+        self.chars = self._column(pos, count)
+        pos += 4 * count
+        self.sizes = self._column(pos, count, "Q")
+        pos += 8 * count
+        self.mtimes = self._column(pos, count, "Q")
+        self._names_start = pos + 8 * count
+
+    def _column(self, pos, length, typecode="I"):
+        column = array(typecode)
+        column.frombytes(self._mm[pos:pos + column.itemsize * length])
+        if sys.byteorder != "little":
+            column.byteswap()
+        return column
+
+    def __len__(self):
+        return self.count
+
+    def name(self, i):
+        start = self._names_start
+        return self._mm[start + self._offsets[i]:start + self._offsets[i + 1]].decode('utf-8')
+
+    def names(self, rows=None):
+        return [self.name(i) for i in (range(self.count) if rows is None else rows)]
+
+    def is_current(self, data_dir):
+        """True if data_dir holds exactly the indexed files, each with its indexed size and mtime."""
+        listing = _listing(data_dir)
+        return len(listing) == self.count and all(
+            (name, size, mtime) == (self.name(i), self.sizes[i], self.mtimes[i])
+            for i, (name, size, mtime) in enumerate(listing))
+
+    def close(self):
+        self._mm.close()
+
+
+def load_index(data_dir, index_path=None):
+    """Open the index of data_dir, (re)building it first if it is missing, of an older version or stale."""
+    index_path = index_path or index_path_for(data_dir)
+    if os.path.exists(index_path):
+        try:
+            index = CorpusIndex(index_path)
+        except (ValueError, struct.error):
+            pass
+        else:
+            if index.is_current(data_dir):
+                return index
+            index.close()
+    build_index(data_dir, index_path)
+    return CorpusIndex(index_path)
+
+
+def _stratified_sample(rows, turns, k, rng, bins=4):
+    """k rows spread over `bins` turn-count quantile bins in proportion to their size."""
+    ordered = sorted(rows, key=lambda i: turns[i])
+    strata = [ordered[len(ordered) * b // bins:len(ordered) * (b + 1) // bins] for b in range(bins)]
+    picked = []
+    for b, stratum in enumerate(strata):
+        share = k * (b + 1) // bins - k * b // bins
+        picked += rng.sample(stratum, min(share, len(stratum)))
+    return sorted(picked)
+
+
+def select(index, ids=None, sample=None, seed=0, stratify=False, min_turns=None, max_turns=None,
+           min_chars=None, max_chars=None, limit=None):
+    """
+    File names from the index, in index (sorted) order:
+    ids            only these file names (with or without ".json")
+    min/max_turns  inclusive bounds on the number of entries
+    min/max_chars  inclusive bounds on total content characters
+    sample, seed   a reproducible random sample of that many of the remaining rows
+    stratify       spread the sample evenly over turn-count quartiles
+    limit          keep at most the first N
+    """
+    turns, chars = index.turns, index.chars
+    rows = range(len(index))
+    if min_turns is not None:
+        rows = [i for i in rows if turns[i] >= min_turns]
+    if max_turns is not None:
+        rows = [i for i in rows if turns[i] <= max_turns]
+    if min_chars is not None:
+        rows = [i for i in rows if chars[i] >= min_chars]
+    if max_chars is not None:
+        rows = [i for i in rows if chars[i] <= max_chars]
+    if ids is not None:
+        wanted = {name if name.lower().endswith('.json') else name + '.json' for name in ids}
+        rows = [i for i in rows if index.name(i) in wanted]
+    rows = list(rows)
+    if sample is not None and sample < len(rows):
+        rng = random.Random(seed)
+        rows = _stratified_sample(rows, turns, sample, rng) if stratify else sorted(rng.sample(rows, sample))
+    if limit is not None:
+        rows = rows[:limit]
+    return index.names(rows)
+
+
+def select_files(data_dir, **selectors):
+    """Paths of the selected conversation files in data_dir (all of them without selectors)."""
+    if not os.path.isdir(data_dir):
+        return []
+    index = load_index(data_dir)
+    try:
+        return [os.path.join(data_dir, name) for name in select(index, **selectors)]
+    finally:
+        index.close()
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a corpus index.")
+    parser.add_argument("command", choices=("build", "select"))
+    parser.add_argument("data_dir")
+    parser.add_argument("--ids", help="comma-separated file names")
+    parser.add_argument("--sample", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stratify", action="store_true")
+    parser.add_argument("--min-turns", type=int)
+    parser.add_argument("--max-turns", type=int)
+    parser.add_argument("--min-chars", type=int)
+    parser.add_argument("--max-chars", type=int)
+    parser.add_argument("--limit", type=int)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.command == "build":
+        index = CorpusIndex(build_index(args.data_dir))
+        print(f"Indexed {len(index)} conversations → {index.path}")
+    else:
+        for path in select_files(args.data_dir, ids=args.ids.split(",") if args.ids else None,
+                                 sample=args.sample, seed=args.seed, stratify=args.stratify,
+                                 min_turns=args.min_turns, max_turns=args.max_turns,
+                                 min_chars=args.min_chars, max_chars=args.max_chars, limit=args.limit):
+            print(path)
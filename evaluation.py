@@ -5,24 +5,83 @@
 CBT-style per-utterance evaluator
 --------------------------------
 • Reads conversation JSON files from ./data/
-• Sends each therapist reply (with full context) to an OpenAI model
+• Sends each therapist reply (with full context) to an OpenAI model,
+  many files and turns at once, paced by a shared RPM/TPM rate limiter
 • Receives seven numeric scores, computes per-turn and overall averages,
   and saves everything to ./results/
 """
 
 import os
-import glob
+import sys
 import json
-import time
+import math
+import random
 import statistics
+import concurrent.futures
 import openai
 
+from batch_io import read_results, write_requests
+from cascade import CascadeStats, escalation_reason, sample_mean
+from checkpoint import read_journal
+from corpus_index import select_files
+from ratelimit import RateLimiter
+from resilience import retry_call
+from response_cache import ResponseCache
+from result_sink import ShardedSink
+from sampling import ClusterMeans, TurnSampler
+from scores import (BATCH_RESPONSE_FORMAT, REASK_RESPONSE_FORMAT, SCORE_RESPONSE_FORMAT, ParseStats,
+                    coerce_scores, parse_reask, parse_scores_detail, reask_messages)
+from telemetry import Telemetry
+from tokens import count_message_tokens
+from turn_rules import RuleStats, check_turns
+from usage import UsageStats
+
 # ───────────────────────────────────────────────────────────────
 # 1.  Configuration
 # ───────────────────────────────────────────────────────────────
-openai.api_key = ""
+openai.api_key = os.environ.get("OPENAI_API_KEY", "")  # or paste your key here
+openai.max_retries = 0                            # retries: resilience.retry_call
+BASE_URL       = os.environ.get("OPENAI_BASE_URL") # e.g. fake_server.py for load tests
+if BASE_URL:
+    openai.base_url = BASE_URL.rstrip("/") + "/"  # the module-level client needs the trailing slash
 MODEL_NAME     = "gpt-4o"                         # change if desired
-RATE_LIMIT_SEC = 1.0                              # crude delay between calls
+RPM_LIMIT      = 500                              # requests/min for your account tier
+TPM_LIMIT      = 30_000                           # tokens/min for your account tier
+MAX_WORKERS    = 8                                # files evaluated in parallel
+MAX_IN_FLIGHT  = 32                               # scoring requests in flight
+REPLY_TOKENS   = 200                              # reserved per call until usage is known
+LIMITER        = RateLimiter(rpm=RPM_LIMIT, tpm=TPM_LIMIT)
+USAGE          = UsageStats()                     # token and prompt-cache counters
+METRICS_LOG    = os.path.join("results", "evaluation_metrics.jsonl")  # per-call latency/tokens/cost; None = off
+TELEMETRY      = Telemetry(METRICS_LOG)
+CACHE          = ResponseCache(mode="readwrite")  # "off" | "readwrite" | "replay"
+SCORING_MODE   = "json_schema"                    # "json_schema" (typed structured output) | "text" (seven numbers)
+REASK_MODEL    = "gpt-4o-mini"                    # cheap model that repairs malformed score answers; None = drop them
+PARSES         = ParseStats()                     # how score answers were read (and how many were lost)
+PRESCREEN      = True                             # check turns against the therapist prompt's rules locally (turn_rules.py)
+PRESCREEN_SKIP = ("empty", "instruction_dump")    # rules whose turns are never sent to the scorer; others are only flagged
+RULE_STATS     = RuleStats()
+BATCH_SCORING  = True                             # score many turns per request
+BATCH_WINDOW   = 0                                # turns per batched request (0 = whole file)
+SELECT         = {}                               # corpus-index selectors, e.g. {"sample": 200, "seed": 1}
+RESULT_SINK    = "files"                          # "files" | "jsonl" (sharded JSONL in results/shards)
+SINK           = ShardedSink(os.path.join("results", "shards"), "evaluations") if RESULT_SINK == "jsonl" else None
+# Adaptive mode (python evaluation.py adaptive): sample turns until every mean is known well enough
+ADAPTIVE_HALF_WIDTH    = 0.05                     # target CI half-width for each modality × dimension mean
+ADAPTIVE_CONFIDENCE    = 0.95
+ADAPTIVE_MAX_CALLS     = 5000                     # budget: scoring calls across all modalities (None = no cap)
+ADAPTIVE_ROUND         = 32                       # turns scored per modality between precision checks
+ADAPTIVE_MIN_CONVERSATIONS = 30                   # never stop a modality on fewer sampled conversations
+# Cascade: score with a cheap model first, rescore only uncertain turns with MODEL_NAME
+CASCADE                = False                    # cheap model scores every turn; only uncertain turns go to MODEL_NAME
+CASCADE_MODEL          = "gpt-4o-mini"            # cheap tier
+CASCADE_SAMPLES        = 2                        # cheap scoring passes per turn (at CASCADE_TEMPERATURE when > 1)
+CASCADE_TEMPERATURE    = 0.7
+CASCADE_MAX_SPREAD     = 0.5                      # escalate when cheap samples differ by more on any dimension
+CASCADE_THRESHOLDS     = (2.0,)                   # rubric levels that matter (2 = "adequately meets standards")
+CASCADE_MARGIN         = 0.5                      # escalate a cheap mean this close below a threshold, or between steps above it
+CASCADE_AUDIT_RATE     = 0.05                     # share of confident turns also scored by MODEL_NAME, for agreement
+CASCADE_STATS          = CascadeStats()           # escalations and tier agreement
 
 # ───────────────────────────────────────────────────────────────
 # 2.  The evaluation rubric (system prompt) — FULL TEXT
@@ -167,7 +226,7 @@ Evaluate active therapist engagement that includes:
 **Relationship:** Therapist (bot) – Client (user)
 **Scene:** Virtual SFBT therapeutic session
 
-Format your scores clearly as numbers separated by spaces (e.g., "2 3 2 2 3 2").
+Format your scores clearly as numbers separated by spaces (e.g., "2 3 2 2 3 2 3").
 """
 
 EVALUATION_PROMPT = r"""
@@ -232,105 +291,573 @@ Evaluate active therapist engagement that includes:
 - **Relationship:** Therapist (bot) – Client (user)
 - **Scene:** Virtual CBT therapeutic session
 
-Format your scores clearly as numbers separated by spaces (e.g., "2 3 2 2 3 2").
+Format your scores clearly as numbers separated by spaces (e.g., "2 3 2 2 3 2 3").
 """
+# Rubric for each therapist role label written by GenerateConv.py
+RUBRICS = {
+    "therapist_cbt_prompt":        EVALUATION_PROMPT,
+    "therapist_sfbt_prompt":       EVALUATION_PROMPT_SFBT,
+    "therapist_humanistic_prompt": EVALUATION_PROMPT_Humanistic,
+}
+
 # ───────────────────────────────────────────────────────────────
-# 3.  Helper: call the model and return list[float] of 7 scores
+# 3.  Helpers: call the model and return list[float] of 7 scores
 # ───────────────────────────────────────────────────────────────
-def score_reply(full_convo: str, reply_text: str, idx: int) -> list[float]:
-    """Send one therapist utterance for scoring and return seven floats."""
+_RUBRIC_MODALITY = {rubric: role.split("_")[1] for role, rubric in RUBRICS.items()}
+
+def _limited_create(estimate: int, span, **request):
+    span.attempt(LIMITER.acquire(estimate))
+    return openai.chat.completions.create(**request)
+
+def chat(messages: list[dict], model: str = MODEL_NAME, role: str = "score",
+         modality: str | None = None, **params) -> str:
+    """One chat completion (cached, with retries); returns the reply text."""
+    request = {"model": model, "messages": messages, **params}
+    span = TELEMETRY.span(model, role, modality)
+    cached = CACHE.get(request)
+    if cached is not None:
+        TELEMETRY.finish(span, status="cached")
+        return cached
+    estimate = count_message_tokens(messages, model) + REPLY_TOKENS
+    try:
+        response = retry_call(_limited_create, estimate, span, **request)
+    except Exception as exc:
+        TELEMETRY.finish(span, status=type(exc).__name__)
+        raise
+    TELEMETRY.finish(span, response.usage)
+    if response.usage:
+        LIMITER.settle(estimate, response.usage.total_tokens)
+    USAGE.record(response.usage)
+    content = response.choices[0].message.content
+    CACHE.put(request, content)
+    return content
+
+def score_messages(full_convo: str, reply_text: str, idx: int, rubric: str = EVALUATION_PROMPT) -> list[dict]:
+    """Chat messages asking for the seven scores of one therapist utterance."""
     user_msg = (
         "Here is the full conversation so far (UTF-8 JSON):\n\n"
         f"{full_convo}\n\n"
         "Evaluate **only** this therapist reply "
         f"(utterance index {idx}):\n\n"
         f"\"{reply_text}\"\n\n"
-        "Return seven numbers as described."
+        + ("Return the seven scores in the JSON fields, in the order of the dimensions."
+           if SCORING_MODE == "json_schema" else "Return seven numbers as described.")
     )
-
-    response = openai.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": EVALUATION_PROMPT},
+    return [
+        {"role": "system", "content": rubric},
+        {"role": "user",   "content": user_msg}
+    ]
+
+def _output_format(response_format: dict) -> dict:
+    """Request params for the structured-output mode (none in text mode)."""
+    return {"response_format": response_format} if SCORING_MODE == "json_schema" else {}
+
+def read_scores(raw: str, modality: str | None = None) -> tuple[list[float], str]:
+    """
+    (seven floats, how they were read) from a scoring answer. Malformed answers
+    go to REASK_MODEL, which sees only the answer (not the conversation), and
+    come back as "reasked"; ValueError if that fails too.
+    """
+    try:
+        values, how = parse_scores_detail(raw)
+    except ValueError:
+        if not REASK_MODEL:
+            PARSES.record("failed")
+            raise
+        try:
+            values = parse_reask(chat(reask_messages(raw), model=REASK_MODEL, role="reask", modality=modality,
+                                      temperature=0, response_format=REASK_RESPONSE_FORMAT))
+        except Exception:
+            PARSES.record("failed")
+            raise
+        how = "reasked"
+    PARSES.record(how)
+    return values, how
+
+def score_reply_detail(full_convo: str, reply_text: str, idx: int, rubric: str = EVALUATION_PROMPT,
+                       model: str = MODEL_NAME, role: str = "score", **params) -> tuple[list[float], str]:
+    """score_reply, also returning how the answer was read (see read_scores)."""
+    modality = _RUBRIC_MODALITY.get(rubric)
+    raw = chat(score_messages(full_convo, reply_text, idx, rubric), model=model, role=role, modality=modality,
+               **{"temperature": 0, **params}, **_output_format(SCORE_RESPONSE_FORMAT))
+    return read_scores(raw, modality)
+
+def score_reply(full_convo: str, reply_text: str, idx: int, rubric: str = EVALUATION_PROMPT) -> list[float]:
+    """Send one therapist utterance for scoring and return seven floats."""
+    return score_reply_detail(full_convo, reply_text, idx, rubric)[0]
+
+BATCH_INSTRUCTIONS = (
+    "Evaluate **each** of the therapist replies listed below separately, "
+    "using the seven dimensions described.\n\n"
+    "{replies}\n\n"
+    "{output}"
+)
+BATCH_OUTPUT_JSON = (
+    "Return only a JSON object of the form "
+    "{\"scores\": [{\"utterance_index\": <int>, \"scores\": [d1, d2, d3, d4, d5, d6, d7]}, ...]} "
+    "with exactly one entry per listed utterance index."
+)
+BATCH_OUTPUT_SCHEMA = "Return exactly one entry per listed utterance index, with its seven scores in the JSON fields."
+
+def score_replies_batch(full_convo: str, turns: list[tuple[int, str]], rubric: str = EVALUATION_PROMPT,
+                        model: str = MODEL_NAME, role: str = "score_batch", **params) -> dict[int, list[float]]:
+    """
+    Score several therapist utterances in one request. Returns {index: seven
+    floats} for every turn whose entry passed validation; the rest are left
+    out so the caller can fall back to score_reply for them.
+    """
+    replies = "\n\n".join(f"utterance index {idx}:\n\"{text}\"" for idx, text in turns)
+    user_msg = (
+        "Here is the full conversation so far (UTF-8 JSON):\n\n"
+        f"{full_convo}\n\n"
+        + BATCH_INSTRUCTIONS.format(
+            replies=replies,
+            output=BATCH_OUTPUT_SCHEMA if SCORING_MODE == "json_schema" else BATCH_OUTPUT_JSON)
+    )
+    raw = chat(
+        [
+            {"role": "system", "content": rubric},
             {"role": "user",   "content": user_msg}
         ],
-        temperature=0
+        model=model,
+        role=role,
+        modality=_RUBRIC_MODALITY.get(rubric),
+        **{"temperature": 0, **params},
+        response_format=BATCH_RESPONSE_FORMAT if SCORING_MODE == "json_schema" else {"type": "json_object"}
     )
-    raw = response.choices[0].message.content.strip()
-    numbers = [float(x) for x in raw.split()]
-    if len(numbers) != 7:
-        raise ValueError(f"Expected 7 numbers, got: '{raw}'")
-    return numbers
+    try:
+        entries = json.loads(raw)["scores"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return {}
+
+    wanted = {idx for idx, _ in turns}
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        idx, values = entry.get("utterance_index"), entry.get("scores")
+        values = coerce_scores(values)  # a [d1..d7] list, or the schema's {dimension: score} object
+        if idx in wanted and idx not in results and values is not None:
+            results[idx] = values
+            PARSES.record("batch")
+    return results
+
+# Requests for the turns of every file share one pool; the limiter, not a
+# fixed sleep, decides how fast they go out.
+_CALL_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT)
+_AUDIT_RNG = random.Random(0)
+
+def _try_batch(full_convo: str, chunk: list[tuple[int, str]], rubric: str, **options) -> dict[int, list[float]]:
+    try:
+        return score_replies_batch(full_convo, chunk, rubric, **options)
+    except Exception as exc:
+        print(f"   ! batch of {len(chunk)} turns failed: {exc}")
+        return {}
+
+def _try_reply(full_convo: str, turn: tuple[int, str], rubric: str, **options) -> tuple[list[float], str] | None:
+    idx, text = turn
+    try:
+        return score_reply_detail(full_convo, text, idx, rubric, **options)
+    except Exception as exc:
+        print(f"   ! turn {idx} failed: {exc}")
+        return None
+
+def score_pass(full_convo: str, turns: list[tuple[int, str]], rubric: str = EVALUATION_PROMPT,
+               model: str = MODEL_NAME, role: str = "score", **params) -> tuple[dict[int, list[float]], set[int]]:
+    """
+    One scoring pass over `turns` with `model`, batched when BATCH_SCORING is
+    on. Returns the scores of every turn that could be scored and the indices
+    of the turns whose answers needed a re-ask or could not be read.
+    """
+    scores: dict[int, list[float]] = {}
+    if BATCH_SCORING and turns:
+        window = BATCH_WINDOW or len(turns)
+        chunks = [turns[start:start + window] for start in range(0, len(turns), window)]
+        batch_role = role.replace("score", "score_batch", 1)
+        for result in _CALL_POOL.map(lambda chunk: _try_batch(full_convo, chunk, rubric, model=model,
+                                                               role=batch_role, **params), chunks):
+            scores.update(result)
+        missing = [t for t in turns if t[0] not in scores]
+        if missing:
+            print(f"   … {len(missing)} turns fell back to per-turn scoring")
+    else:
+        missing = turns
+
+    trouble = set()
+    results = _CALL_POOL.map(lambda turn: _try_reply(full_convo, turn, rubric, model=model, role=role, **params),
+                             missing)
+    for (idx, _), result in zip(missing, results):
+        if result is None:
+            trouble.add(idx)
+            continue
+        scores[idx], how = result
+        if how == "reasked":
+            trouble.add(idx)
+    return scores, trouble
+
+def cascade_score_turns(full_convo: str, turns: list[tuple[int, str]],
+                        rubric: str = EVALUATION_PROMPT) -> dict[int, list[float]]:
+    """
+    Score every turn with CASCADE_MODEL (CASCADE_SAMPLES passes) and rescore
+    with MODEL_NAME the turns that look uncertain (cascade.escalation_reason)
+    plus a CASCADE_AUDIT_RATE sample of the rest. The expensive tier's scores
+    win where it answered; both tiers' scores feed CASCADE_STATS.
+    """
+    samples: dict[int, list[list[float]]] = {idx: [] for idx, _ in turns}
+    trouble: set[int] = set()
+    for n in range(CASCADE_SAMPLES):
+        params = {"temperature": CASCADE_TEMPERATURE, "seed": n} if CASCADE_SAMPLES > 1 else {}
+        scores, failed = score_pass(full_convo, turns, rubric, model=CASCADE_MODEL, role="score_cheap", **params)
+        trouble |= failed
+        for idx, values in scores.items():
+            samples[idx].append(values)
+
+    cheap, reasons, recheck = {}, {}, []
+    for turn in turns:
+        idx = turn[0]
+        reason = escalation_reason(samples[idx], idx in trouble, CASCADE_THRESHOLDS,
+                                   CASCADE_MARGIN, CASCADE_MAX_SPREAD)
+        if samples[idx]:
+            cheap[idx] = sample_mean(samples[idx])
+        reasons[idx] = reason
+        if reason or _AUDIT_RNG.random() < CASCADE_AUDIT_RATE:
+            recheck.append(turn)
+        CASCADE_STATS.record(reason)
+
+    expensive, _ = score_pass(full_convo, recheck, rubric, role="score_escalated") if recheck else ({}, set())
+    for idx, values in expensive.items():
+        if idx in cheap:
+            CASCADE_STATS.compare("escalated" if reasons[idx] else "audited", cheap[idx], values)
+    return {**cheap, **expensive}
+
+def score_turns(full_convo: str, turns: list[tuple[int, str]],
+                rubric: str = EVALUATION_PROMPT) -> dict[int, list[float]]:
+    """Scores for every turn that could be scored (through the cascade when CASCADE is on)."""
+    if CASCADE:
+        return cascade_score_turns(full_convo, turns, rubric)
+    return score_pass(full_convo, turns, rubric)[0]
 
 # ───────────────────────────────────────────────────────────────
 # 4.  Main batch-processing loop
 # ───────────────────────────────────────────────────────────────
+def load_turns(path: str) -> tuple[str, list[tuple[int, str]], str]:
+    """
+    The conversation as the JSON string sent for context, its therapist turns,
+    and the rubric matching their role label (CBT if there are none).
+    """
+    with open(path, encoding="utf-8") as f:
+        convo = json.load(f)
+
+    full_convo_str = json.dumps(convo, ensure_ascii=False, indent=2)
+    roles = [msg.get("role") for msg in convo]
+    role = next((r for r in roles if r in RUBRICS), "therapist_cbt_prompt")
+    turns = [(idx, msg["content"]) for idx, msg in enumerate(convo) if msg.get("role") == role]
+    return full_convo_str, turns, RUBRICS[role]
+
+def prescreen(path: str, turns: list[tuple[int, str]]) -> tuple[list[tuple[int, str]], dict[int, list[str]]]:
+    """
+    The turns that may go to the scorer, and the rule violations of every
+    flagged turn (turn_rules). Turns breaking a PRESCREEN_SKIP rule are dropped.
+    """
+    if not PRESCREEN:
+        return turns, {}
+    keep, flags = [], {}
+    for (idx, text), violations in zip(turns, check_turns([text for _, text in turns])):
+        skip = any(rule in PRESCREEN_SKIP for rule in violations)
+        RULE_STATS.record(violations, "skipped" if skip else "flagged" if violations else None)
+        if violations:
+            flags[idx] = violations
+        if skip:
+            print(f"   ⛔  {os.path.basename(path)} turn {idx} not scored: {', '.join(violations)}")
+        else:
+            keep.append((idx, text))
+    return keep, flags
+
+def turn_record(idx: int, reply: str, scores: list[float], violations: list[str] | None = None) -> dict:
+    record = {
+        "utterance_index": idx,
+        "therapist_reply": reply,
+        "scores": scores,
+        "avg_turn_score": statistics.mean(scores)
+    }
+    if violations:
+        record["rule_violations"] = violations
+    return record
+
+def evaluate_file(path: str) -> tuple[list[dict], str | None]:
+    """Score every therapist turn of one conversation file; returns per-turn records in order and the modality."""
+    full_convo_str, turns, rubric = load_turns(path)
+    turns, flags = prescreen(path, turns)
+    scored = score_turns(full_convo_str, turns, rubric)
+    return ([turn_record(idx, reply, scored[idx], flags.get(idx)) for idx, reply in turns if idx in scored],
+            _RUBRIC_MODALITY.get(rubric))
+
+def summarize(path: str, per_turn: list[dict], modality: str | None = None) -> dict:
+    num_turns = len(per_turn)
+    dim_totals = [0.0] * 7  # accumulate per-dimension sums
+    for pt in per_turn:
+        dim_totals = [t + s for t, s in zip(dim_totals, pt["scores"])]
+    overall_avg = statistics.mean(pt["avg_turn_score"] for pt in per_turn)
+    per_dim_avg = [round(t / num_turns, 4) for t in dim_totals]
+
+    return {
+        "file": os.path.basename(path),
+        "modality": modality,
+        "num_therapist_turns": num_turns,
+        "overall_avg_score": round(overall_avg, 4),
+        "per_dimension_avg": per_dim_avg
+    }
+
+def write_outputs(path: str, per_turn: list[dict], modality: str | None = None) -> None:
+    """
+    Write <name>_evaluations.json and, if anything was scored, <name>_summary.json
+    (or one record with both to the JSONL sink when RESULT_SINK is "jsonl").
+    """
+    summary = summarize(path, per_turn, modality) if per_turn else None
+    if SINK is not None:
+        name = os.path.basename(path)
+        SINK.append(name, {"file": name, "evaluations": per_turn, "summary": summary})
+        print(f"   ✅  Appended evaluations → {SINK.directory} [{name}]")
+        if summary is None:
+            print("   (No therapist turns found)")
+        return
+
+    # ── write per-turn evaluations ──────────────────────────
+    eval_out = os.path.join(
+        "results",
+        os.path.basename(path).replace(".json", "_evaluations.json")
+    )
+    with open(eval_out, "w", encoding="utf-8") as wf:
+        json.dump(per_turn, wf, ensure_ascii=False, indent=2)
+    print(f"   ✅  Saved per-turn evaluations → {eval_out}")
+
+    # ── write summary stats ─────────────────────────────────
+    if summary is not None:
+        summary_out = os.path.join(
+            "results",
+            os.path.basename(path).replace(".json", "_summary.json")
+        )
+        with open(summary_out, "w", encoding="utf-8") as sf:
+            json.dump(summary, sf, ensure_ascii=False, indent=2)
+        print(f"   📊  Saved summary → {summary_out}")
+    else:
+        print("   (No therapist turns found)")
+
 def main() -> None:
     os.makedirs("results", exist_ok=True)
-    json_paths = glob.glob(os.path.join("data", "*.json"))
+    json_paths = select_files("data", **SELECT)
     if not json_paths:
         print("❌  No conversation files found in ./data/")
         return
 
-    for path in json_paths:
-        print(f"\n🗂️  Processing {os.path.basename(path)}")
-        with open(path, encoding="utf-8") as f:
-            convo = json.load(f)
+    # Files are scored concurrently; results are reported and written from
+    # this thread only, each file's turns in utterance order.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(evaluate_file, path): path for path in json_paths}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            print(f"\n🗂️  Processed {os.path.basename(path)}")
+            try:
+                per_turn, modality = future.result()
+            except Exception as exc:
+                print(f"   ! file failed: {exc}")
+                continue
+            for pt in per_turn:
+                print(f"   • turn {pt['utterance_index']:>3} → {pt['scores']} | avg {pt['avg_turn_score']:.2f}")
+            write_outputs(path, per_turn, modality)
+
+    print(f"\n🧮  Token usage: {USAGE.summary()}")
+    print(f"🗃️  Response cache: {CACHE.summary()}")
+    print(f"🔢  Score answers: {PARSES.summary()}")
+    if PRESCREEN:
+        print(f"🧹  Pre-screen: {RULE_STATS.summary()}")
+    if CASCADE:
+        print(f"🪜  Cascade {CASCADE_MODEL} → {MODEL_NAME}: {CASCADE_STATS.summary()}")
+        with open(os.path.join("results", "cascade_stats.json"), "w", encoding="utf-8") as cf:
+            json.dump(CASCADE_STATS.as_dict(), cf, indent=2)
+    print(f"⏱️  Model calls by model | role | modality:\n{TELEMETRY.summary()}")
+    if METRICS_LOG:
+        TELEMETRY.write_summary(os.path.splitext(METRICS_LOG)[0] + "_summary.json")
 
-        full_convo_str = json.dumps(convo, ensure_ascii=False, indent=2)
+# ───────────────────────────────────────────────────────────────
+# 5.  Offline batch mode (batch-endpoint JSONL in / out)
+# ───────────────────────────────────────────────────────────────
+def batch_prepare(requests_path: str) -> int:
+    """Write one scoring request per therapist turn of every file in ./data/."""
+    requests = []
+    for path in select_files("data", **SELECT):
+        full_convo_str, turns, rubric = load_turns(path)
+        turns, _ = prescreen(path, turns)
+        for idx, reply in turns:
+            body = {"model": MODEL_NAME,
+                    "messages": score_messages(full_convo_str, reply, idx, rubric),
+                    "temperature": 0,
+                    **_output_format(SCORE_RESPONSE_FORMAT)}
+            requests.append((f"{os.path.basename(path)}|{idx}", body))
+    count = write_requests(requests_path, requests)
+    print(f"📝  Wrote {count} scoring requests → {requests_path}")
+    return count
+
+def batch_ingest(results_path: str) -> None:
+    """Turn a batch results JSONL into the usual _evaluations.json / _summary.json files."""
+    os.makedirs("results", exist_ok=True)
+    replies = read_results(results_path)
+    for path in select_files("data", **SELECT):
+        name = os.path.basename(path)
+        _, turns, rubric = load_turns(path)
+        turns, flags = prescreen(path, turns)
+        if not any(f"{name}|{idx}" in replies for idx, _ in turns):
+            continue
+        print(f"\n🗂️  Ingesting {name}")
         per_turn = []
-        dim_totals = [0.0] * 7  # accumulate per-dimension sums
-
-        for idx, msg in enumerate(convo):
-            if msg.get("role") != "therapist_cbt_prompt":
+        for idx, reply in turns:
+            raw = replies.get(f"{name}|{idx}")
+            if raw is None:
+                print(f"   ! turn {idx} has no result")
                 continue
             try:
-                scores = score_reply(full_convo_str, msg["content"], idx)
-                avg_turn = statistics.mean(scores)
-                dim_totals = [t + s for t, s in zip(dim_totals, scores)]
-
-                per_turn.append({
-                    "utterance_index": idx,
-                    "therapist_reply": msg["content"],
-                    "scores": scores,
-                    "avg_turn_score": avg_turn
-                })
-                print(f"   • turn {idx:>3} → {scores} | avg {avg_turn:.2f}")
-            except Exception as exc:
+                values, how = parse_scores_detail(raw)
+            except ValueError as exc:
+                PARSES.record("failed")
                 print(f"   ! turn {idx} failed: {exc}")
-            time.sleep(RATE_LIMIT_SEC)
+                continue
+            PARSES.record(how)
+            per_turn.append(turn_record(idx, reply, values, flags.get(idx)))
+        write_outputs(path, per_turn, _RUBRIC_MODALITY.get(rubric))
 
-        # ── write per-turn evaluations ──────────────────────────
-        eval_out = os.path.join(
-            "results",
-            os.path.basename(path).replace(".json", "_evaluations.json")
-        )
-        with open(eval_out, "w", encoding="utf-8") as wf:
-            json.dump(per_turn, wf, ensure_ascii=False, indent=2)
-        print(f"   ✅  Saved per-turn evaluations → {eval_out}")
-
-        # ── compute & write summary stats ──────────────────────
-        if per_turn:
-            num_turns = len(per_turn)
-            overall_avg = statistics.mean(pt["avg_turn_score"] for pt in per_turn)
-            per_dim_avg = [round(t / num_turns, 4) for t in dim_totals]
-
-            summary = {
-                "file": os.path.basename(path),
-                "num_therapist_turns": num_turns,
-                "overall_avg_score": round(overall_avg, 4),
-                "per_dimension_avg": per_dim_avg
-            }
-            summary_out = os.path.join(
-                "results",
-                os.path.basename(path).replace(".json", "_summary.json")
-            )
-            with open(summary_out, "w", encoding="utf-8") as sf:
-                json.dump(summary, sf, ensure_ascii=False, indent=2)
-            print(f"   📊  Saved summary → {summary_out}")
-        else:
-            print("   (No therapist_cbt turns found)")
+# ───────────────────────────────────────────────────────────────
+# 6.  Adaptive sampled evaluation (corpus-level means only)
+# ───────────────────────────────────────────────────────────────
+def _precision_line(modality: str, means: ClusterMeans, estimate: list[tuple[float, float]]) -> str:
+    widest = max(half for _, half in estimate)
+    return (f"{modality}: {means.turns} turns from {means.conversations} conversations, "
+            f"widest ±{widest:.3f}")
+
+def _reload_adaptive_log(log_path: str, conversations: dict, by_modality: dict,
+                         samplers: dict, means: dict) -> int:
+    """Feed turns scored by earlier runs back into means and samplers; returns how many."""
+    paths = {os.path.basename(p): (m, p) for m, ps in by_modality.items() for p in ps}
+    resumed = 0
+    for record in read_journal(log_path):        # also cuts a torn tail, so appends start cleanly
+        modality, path = paths.get(record.get("file"), (None, None))
+        idx, values = record.get("utterance_index"), record.get("scores")
+        if path is None or idx not in conversations[path][1] or not isinstance(values, list) \
+                or len(values) != 7:
+            continue                             # seed or turn no longer selected, or not a score
+        if samplers[modality].take(path, idx):
+            means[modality].add(path, values)
+            resumed += 1
+    return resumed
+
+def adaptive_evaluate(seed: int = 0) -> dict:
+    """
+    Estimate each modality's per-dimension mean score without scoring every
+    turn. Turns are drawn with sampling.TurnSampler, ADAPTIVE_ROUND per modality
+    at a time. A modality stops once all seven confidence half-widths are at most
+    ADAPTIVE_HALF_WIDTH (after ADAPTIVE_MIN_CONVERSATIONS conversations), or when
+    its turns run out. Everything stops at ADAPTIVE_MAX_CALLS. Scored turns go
+    to results/adaptive_turns.jsonl, the estimates to results/adaptive_report.json.
+
+    Turns already in results/adaptive_turns.jsonl (from an earlier run) are
+    read back first: they count towards the means and are never scored again.
+    ADAPTIVE_MAX_CALLS caps the new calls of this run.
+    """
+    os.makedirs("results", exist_ok=True)
+    conversations, by_modality = {}, {}
+    for path in select_files("data", **SELECT):
+        full_convo_str, turns, rubric = load_turns(path)
+        turns, _ = prescreen(path, turns)
+        if turns:
+            conversations[path] = (full_convo_str, dict(turns), rubric)
+            by_modality.setdefault(_RUBRIC_MODALITY.get(rubric), []).append(path)
+    if not conversations:
+        print("❌  No conversation files found in ./data/")
+        return {}
+
+    rng = random.Random(seed)
+    z = statistics.NormalDist().inv_cdf(0.5 + ADAPTIVE_CONFIDENCE / 2)
+    samplers = {m: TurnSampler({p: list(conversations[p][1]) for p in paths}, rng)
+                for m, paths in by_modality.items()}
+    means = {m: ClusterMeans({p: len(conversations[p][1]) for p in paths})
+             for m, paths in by_modality.items()}
+    stopped: dict[str, str] = {}
+    calls = 0
+    log_path = os.path.join("results", "adaptive_turns.jsonl")
+    resumed = _reload_adaptive_log(log_path, conversations, by_modality, samplers, means)
+    if resumed:
+        print(f"↩️  {resumed} turns already scored in {log_path}")
+
+    def score(pick):
+        path, idx = pick
+        full_convo_str, texts, rubric = conversations[path]
+        result = _try_reply(full_convo_str, (idx, texts[idx]), rubric)
+        return result and result[0]
+
+    with open(log_path, "a", encoding="utf-8") as log:
+        while True:
+            picks = []  # interleaved across modalities, so a budget cut hits them evenly
+            for _ in range(ADAPTIVE_ROUND):
+                for modality in sorted(by_modality):
+                    pick = None if modality in stopped else samplers[modality].next()
+                    if pick is not None:
+                        picks.append((modality, pick))
+            if ADAPTIVE_MAX_CALLS is not None:
+                picks = picks[:max(0, ADAPTIVE_MAX_CALLS - calls)]
+            if not picks:
+                break
+            calls += len(picks)
+            for (modality, (path, idx)), values in zip(picks, _CALL_POOL.map(lambda p: score(p[1]), picks)):
+                if values is None:
+                    continue
+                means[modality].add(path, values)
+                log.write(json.dumps({"file": os.path.basename(path), "modality": modality,
+                                      "utterance_index": idx, "scores": values}, ensure_ascii=False) + "\n")
+            log.flush()
+
+            progress = []
+            for modality in sorted(by_modality):
+                estimate = means[modality].estimate(z)
+                progress.append(_precision_line(modality, means[modality], estimate))
+                if (modality not in stopped and means[modality].conversations >= ADAPTIVE_MIN_CONVERSATIONS
+                        and all(half <= ADAPTIVE_HALF_WIDTH for _, half in estimate)):
+                    stopped[modality] = "target precision"
+            print(f"🎯  {calls} calls | " + " | ".join(progress))
+            if ADAPTIVE_MAX_CALLS is not None and calls >= ADAPTIVE_MAX_CALLS:
+                break
+
+    report = {"confidence": ADAPTIVE_CONFIDENCE, "target_half_width": ADAPTIVE_HALF_WIDTH,
+              "calls": calls, "resumed_turns": resumed, "modalities": {}}
+    for modality in sorted(by_modality):
+        estimate = means[modality].estimate(z)
+        report["modalities"][modality] = {
+            "stopped": stopped.get(modality) or ("all turns scored" if samplers[modality].exhausted else "budget"),
+            "conversations_sampled": means[modality].conversations,
+            "conversations_total": len(by_modality[modality]),
+            "turns_scored": means[modality].turns,
+            "turns_total": sum(len(conversations[p][1]) for p in by_modality[modality]),
+            "per_dimension": [
+                {"mean": round(mean, 4), "half_width": None if math.isinf(half) else round(half, 4)}
+                for mean, half in estimate
+            ],
+        }
+    with open(os.path.join("results", "adaptive_report.json"), "w", encoding="utf-8") as rf:
+        json.dump(report, rf, ensure_ascii=False, indent=2)
+
+    for modality, entry in report["modalities"].items():
+        cells = " ".join(f"{d['mean']:.2f}±{d['half_width'] if d['half_width'] is not None else float('inf'):.2f}"
+                         for d in entry["per_dimension"])
+        print(f"\n📈  {modality} ({entry['stopped']}; {entry['turns_scored']}/{entry['turns_total']} turns): {cells}")
+    print(f"⏱️  Model calls by model | role | modality:\n{TELEMETRY.summary()}")
+    return report
 
 if __name__ == "__main__":
-    main()
+    # python evaluation.py batch-prepare <requests.jsonl> | batch-ingest <results.jsonl> | adaptive
+    if len(sys.argv) > 1 and sys.argv[1] == "adaptive":
+        adaptive_evaluate()
+    elif len(sys.argv) > 2 and sys.argv[1] == "batch-prepare":
+        batch_prepare(sys.argv[2])
+    elif len(sys.argv) > 2 and sys.argv[1] == "batch-ingest":
+        batch_ingest(sys.argv[2])
+    else:
+        main()
 
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local OpenAI-compatible stand-in for load testing the pipelines
+----------------------------------------------------------------
+• Serves POST /v1/chat/completions with canned therapist / client / summary /
+  score replies and token usage counted locally
+• Simulates latency (constant, uniform or lognormal), injects 429s (with
+  Retry-After) and 5xx errors, and can enforce its own RPM / TPM limits
+• Streams ("stream": true) as server-sent events, token by token, and can
+  make some streamed replies run on for paragraphs to exercise early aborts
+• Can answer some plain-text scoring requests in prose (--malformed-rate)
+  to exercise the evaluator's tolerant parser and re-ask
+• Reports the concurrency and request rate it actually observed on
+  GET /stats and when it shuts down
+
+Usage:
+    python fake_server.py --port 8000 --latency lognormal:-0.5,0.6 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=fake python GenerateConv.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_io import canned_reply, completion_body
+
+STREAM_PIECE_CHARS = 2      # characters per streamed delta, roughly one token of Chinese text
+MALFORMED_SCORES = (        # plain-text score answers as models get them wrong: one parseable, one not
+    "Here are my scores:\n1. Language fluency: 2\n2. Relevance: 2\n3. Role consistency: 2\n"
+    "4. Techniques: 2\n5. Session flow: 2\n6. Empathy: 2\n7. Engagement: 2",
+    "I would rate this reply two across the board for fluency, relevance, role, techniques, "
+    "flow, empathy and engagement.",
+)
+
+
+def parse_latency(spec):
+    """'const:0.5', 'uniform:0.2,1.5' or 'lognormal:mu,sigma' -> a zero-argument sampler (seconds)."""
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",")] if args else []
+    if kind == "const":
+        return lambda: params[0] if params else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(params[0], params[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+class ServerStats:
+    """What the server saw: in-flight concurrency, request/token rates, injected failures."""
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_rpm = 0
+        self.status_counts = {}
+        self.started = time.monotonic()
+        self._window = deque()          # (timestamp, tokens) over the last 60s
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        while self._window and now - self._window[0][0] > 60:
+            self._window.popleft()
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self, status, tokens=0):
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if status == 200:
+                self.requests += 1
+                self.tokens += tokens
+                self._window.append((now, tokens))
+                self._trim(now)
+                self.peak_rpm = max(self.peak_rpm, len(self._window))
+
+    def current_rates(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return len(self._window), sum(t for _, t in self._window)
+
+    def snapshot(self):
+        rpm, tpm = self.current_rates()
+        elapsed = time.monotonic() - self.started
+        return {
+            "elapsed_sec": round(elapsed, 1),
+            "requests_ok": self.requests,
+            "tokens": self.tokens,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "rpm_last_60s": rpm,
+            "tpm_last_60s": tpm,
+            "peak_rpm": self.peak_rpm,
+            "mean_rpm": round(self.requests / elapsed * 60, 1) if elapsed else 0.0,
+            "status_counts": {str(k): v for k, v in sorted(self.status_counts.items())},
+        }
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None                       # argparse namespace, set in serve()
+    stats = None
+    latency = None
+
+    def log_message(self, fmt, *args):  # keep the console for the stats report
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, response, include_usage):
+        """Replay a completion as chat.completion.chunk events; returns False if the client hung up."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": response["id"], "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": response["model"]}
+        content = response["choices"][0]["message"]["content"]
+        pieces = [content[i:i + STREAM_PIECE_CHARS] for i in range(0, len(content), STREAM_PIECE_CHARS)]
+        events = [{**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}]
+        events += [{**base, "choices": [{"index": 0, "delta": {"content": p}, "finish_reason": None}]} for p in pieces]
+        events.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if include_usage:
+            events.append({**base, "choices": [], "usage": response["usage"]})
+        try:
+            for event in events:
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self.config.token_latency)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+        return True
+
+    def _error(self, status, message, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": "fake_server_error", "code": status}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.stats.snapshot())
+        else:
+            self._error(404, f"Unknown path {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._error(404, f"Unknown path {self.path}")
+            return
+
+        cfg = self.config
+        self.stats.begin()
+        status, tokens = 200, 0
+        try:
+            time.sleep(max(0.0, self.latency()))
+            rpm, tpm = self.stats.current_rates()
+            roll = random.random()
+            if (cfg.rpm and rpm >= cfg.rpm) or (cfg.tpm and tpm >= cfg.tpm) or roll < cfg.throttle_rate:
+                status = 429
+                self._error(429, "Rate limit reached (fake server)", {"retry-after": str(cfg.retry_after)})
+                return
+            if roll < cfg.throttle_rate + cfg.error_rate:
+                status = random.choice((500, 502, 503))
+                self._error(status, "Injected server error (fake server)")
+                return
+            content = canned_reply(body)
+            if content == "2 2 2 2 2 2 2" and random.random() < cfg.malformed_rate:
+                content = random.choice(MALFORMED_SCORES)
+            if body.get("stream") and random.random() < cfg.runaway_rate:
+                content = "\n\n".join([content] * 8)
+            response = completion_body(body.get("model", "fake-model"), content, body.get("messages", []))
+            tokens = response["usage"]["total_tokens"]
+            if not body.get("stream"):
+                self._send_json(200, response)
+            elif not self._send_stream(response, (body.get("stream_options") or {}).get("include_usage")):
+                status = 499                    # client closed the stream early
+        finally:
+            self.stats.end(status, tokens)
+
+
+def make_server(config):
+    """Build (but do not start) the server; its stats are on FakeChatHandler.stats."""
+    FakeChatHandler.config = config
+    FakeChatHandler.stats = ServerStats()
+    FakeChatHandler.latency = staticmethod(parse_latency(config.latency))
+    server = ThreadingHTTPServer((config.host, config.port), FakeChatHandler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(config):
+    server = make_server(config)
+    print(f"Fake chat-completions server on http://{config.host}:{config.port}/v1 (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(FakeChatHandler.stats.snapshot(), indent=2))
+    return FakeChatHandler.stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="lognormal:-0.7,0.5",
+                        help="const:S | uniform:LO,HI | lognormal:MU,SIGMA (seconds)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 5xx")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--runaway-rate", type=float, default=0.0,
+                        help="fraction of streamed replies that run on for several paragraphs")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="fraction of plain-text score answers sent as prose instead of seven numbers")
+    parser.add_argument("--rpm", type=int, default=0, help="enforce this requests-per-minute limit (0 = none)")
+    parser.add_argument("--tpm", type=int, default=0, help="enforce this tokens-per-minute limit (0 = none)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    serve(parse_args())
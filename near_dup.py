@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+MinHash / LSH near-duplicate index for short texts (seed openings, generated turns).
+
+A text becomes the set of its character shingles. Lowercase, with whitespace
+and punctuation dropped, so it works the same for Chinese and English.
+Each set is reduced to a MinHash signature of `num_perm` values. Two
+signatures agree in about a Jaccard-similarity share of their positions.
+The signature is cut into `bands` bands. Texts that share any whole band
+become candidates, and only candidates are compared, so a query never
+scans the whole index. A candidate counts as a near duplicate when its
+estimated similarity is at least `threshold`.
+
+Texts shorter than `min_chars` (after normalization) are never matched or
+indexed: a "hello" matches every other "hello" without saying anything
+about the rest of the conversation.
+
+    python near_dup.py ./data [--threshold 0.7]    # clusters of near-identical opening turns
+"""
+import argparse
+import json
+import os
+import random
+import re
+import zlib
+
+from SmileChatProcessing import iter_json_array
+
+_PRIME = (1 << 61) - 1
+_DROP = re.compile(r"[\W_]+")
+
+
+class NearDupIndex:
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle=3, min_chars=20, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.shingle = shingle
+        self.min_chars = min_chars
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(num_perm)]
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def signature(self, text):
+        """MinHash signature of `text`, or None if it is too short to compare."""
+        norm = _DROP.sub("", (text or "").lower())
+        if len(norm) < self.min_chars:
+            return None
+        hashes = {zlib.crc32(norm[i:i + self.shingle].encode("utf-8"))
+                  for i in range(len(norm) - self.shingle + 1)}
+        return tuple(min([(a * h + b) % _PRIME for h in hashes]) for a, b in self._perms)
+
+    def _bands(self, signature):
+        return [signature[b * self.rows:(b + 1) * self.rows] for b in range(self.bands)]
+
+    def query(self, text=None, signature=None):
+        """[(key, estimated similarity)] of indexed texts at or above threshold, most similar first."""
+        signature = signature or self.signature(text)
+        if signature is None:
+            return []
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._bands(signature)):
+            candidates.update(bucket.get(band, ()))
+        matches = []
+        for key in candidates:
+            other = self._signatures[key]
+            similarity = sum(x == y for x, y in zip(signature, other)) / len(signature)
+            if similarity >= self.threshold:
+                matches.append((key, similarity))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def add(self, key, text=None, signature=None):
+        """Index `text` under `key`; returns its signature (None if too short, and then not indexed)."""
+        signature = signature or self.signature(text)
+        if signature is not None:
+            self._signatures[key] = signature
+            for bucket, band in zip(self._buckets, self._bands(signature)):
+                bucket.setdefault(band, []).append(key)
+        return signature
+
+
+def cluster(items, **options):
+    """
+    {first key: [keys]} for (key, text) items, in input order. Each text
+    joins the cluster of its most similar earlier text, or starts its own.
+    """
+    index = NearDupIndex(**options)
+    leader, clusters = {}, {}
+    for key, text in items:
+        signature = index.signature(text)
+        matches = index.query(signature=signature) if signature else []
+        leader[key] = leader[matches[0][0]] if matches else key
+        clusters.setdefault(leader[key], []).append(key)
+        index.add(key, signature=signature)
+    return clusters
+
+
+def opening_turn(path):
+    """Content of the first entry of a conversation file; only that entry is parsed."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            first = next(iter_json_array(f), None)
+    except json.JSONDecodeError:
+        return None
+    return first.get("content") if isinstance(first, dict) else None
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Clusters of seeds with near-identical opening turns.")
+    parser.add_argument("data_dir")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    names = sorted(n for n in os.listdir(args.data_dir) if n.lower().endswith('.json') and not n.startswith('.'))
+    groups = cluster(((n, opening_turn(os.path.join(args.data_dir, n))) for n in names), threshold=args.threshold)
+    duplicated = {first: members for first, members in groups.items() if len(members) > 1}
+    for first, members in duplicated.items():
+        print(f"{len(members):>4}  {', '.join(members)}")
+    print(f"{len(names)} seeds, {len(groups)} distinct openings, "
+          f"{sum(len(m) - 1 for m in duplicated.values())} near duplicates")
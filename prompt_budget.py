@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Local prompt budgeting for generation.
+
+The seed conversation is embedded in every client request, so its encoding is
+the single biggest lever on input tokens. `compact_seed` renders it as
+minified JSON or as role-prefixed plain text (or picks whichever is smaller)
+and can cap the tokens kept per role. `PromptBudget` records the token count
+of every prompt component on every request so the end-of-run report shows
+where the input tokens actually go.
+"""
+import json
+import threading
+
+from tokens import count_tokens
+
+SEED_FORMATS = ("indent", "json", "text", "auto")
+
+
+def trim_seed(conversation_data, max_tokens_per_role, model="gpt-4o-mini"):
+    """
+    Keep entries in order until each role has used `max_tokens_per_role`
+    tokens. The first entry that would overrun a role's budget closes that
+    role: none of its later entries are kept, even short ones, so each role
+    keeps a contiguous prefix of its turns. The first entry is always kept.
+    """
+    if not max_tokens_per_role:
+        return conversation_data
+    used = {}
+    full = set()
+    kept = []
+    for i, entry in enumerate(conversation_data):
+        role = entry.get("role")
+        if role in full:
+            continue
+        tokens = count_tokens(entry.get("content") or "", model)
+        if i > 0 and used.get(role, 0) + tokens > max_tokens_per_role:
+            full.add(role)
+            continue
+        used[role] = used.get(role, 0) + tokens
+        kept.append(entry)
+    return kept
+
+
+def render_seed(conversation_data, fmt):
+    if fmt == "indent":
+        return json.dumps(conversation_data, ensure_ascii=False, indent=2)
+    if fmt == "json":
+        return json.dumps(conversation_data, ensure_ascii=False, separators=(",", ":"))
+    if fmt == "text":
+        return "\n".join(f"{entry.get('role')}: {entry.get('content')}" for entry in conversation_data)
+    raise ValueError(f"Unknown seed format {fmt!r}; expected one of {SEED_FORMATS}")
+
+
+def compact_seed(conversation_data, fmt="json", max_tokens_per_role=None, model="gpt-4o-mini"):
+    """Render the seed conversation for the client prompt in the requested format."""
+    conversation_data = trim_seed(conversation_data, max_tokens_per_role, model)
+    if fmt != "auto":
+        return render_seed(conversation_data, fmt)
+    candidates = [render_seed(conversation_data, f) for f in ("json", "text")]
+    return min(candidates, key=lambda text: count_tokens(text, model))
+
+
+class PromptBudget:
+    """Per-component input-token totals across every request of a run."""
+
+    def __init__(self):
+        self.totals = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def record(self, components):
+        with self._lock:
+            self.requests += 1
+            for name, tokens in components.items():
+                self.totals[name] = self.totals.get(name, 0) + tokens
+
+    def summary(self):
+        grand_total = sum(self.totals.values())
+        lines = [f"{self.requests} requests, {grand_total:,} estimated input tokens"]
+        for name, tokens in sorted(self.totals.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {name:<24} {tokens:>12,}  {tokens / grand_total:6.1%}")
+        return "\n".join(lines)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Requests-per-minute / tokens-per-minute limiter shared by every worker.
+
+Both budgets are token buckets that refill continuously. A caller reserves one
+request plus its estimated tokens up front and then sleeps off any deficit, so
+concurrent callers queue fairly instead of racing each other into 429s. The
+same object works from threads (`acquire`) and from asyncio (`acquire_async`).
+"""
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rpm=None, tpm=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._stamp
+        self._stamp = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def reserve(self, tokens=0):
+        """Take one request and `tokens` tokens; return the seconds to wait before sending."""
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = 0.0
+            if self.rpm:
+                self._requests -= 1
+                wait = max(wait, -self._requests * 60.0 / self.rpm)
+            if self.tpm:
+                self._tokens -= min(tokens, self.tpm)
+                wait = max(wait, -self._tokens * 60.0 / self.tpm)
+            return wait
+
+    def settle(self, estimated, actual):
+        """Correct a reservation once the real token usage is known."""
+        if not self.tpm or actual is None:
+            return
+        with self._lock:
+            self._tokens = min(self.tpm, self._tokens + estimated - actual)
+
+    def acquire(self, tokens=0):
+        """Block until the request may be sent; returns the seconds spent waiting."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
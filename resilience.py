@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Retry, backoff and circuit breaking shared by every model call.
+
+Transient failures (429, 5xx, timeouts, dropped connections) are retried with
+full-jitter exponential backoff, or after the server's Retry-After hint when it
+sends one. A process-wide circuit breaker watches the recent error rate and,
+when it spikes, holds back every worker for a cooldown period instead of
+letting them keep hammering a throttled endpoint.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import openai
+
+MAX_ATTEMPTS = 8          # first try included
+BACKOFF_BASE_SEC = 1.0
+BACKOFF_CAP_SEC = 60.0
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitBreaker:
+    """Pauses all callers for `cooldown` seconds when the recent error rate spikes."""
+
+    def __init__(self, window=50, threshold=0.5, min_calls=10, cooldown=30.0):
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        return max(0.0, self._open_until - time.monotonic())
+
+    def pause(self, seconds):
+        with self._lock:
+            self._open_until = max(self._open_until, time.monotonic() + seconds)
+
+    def record(self, ok):
+        with self._lock:
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) < self.min_calls or failures / len(self._outcomes) < self.threshold:
+                return
+            self._outcomes.clear()
+            self._open_until = max(self._open_until, time.monotonic() + self.cooldown)
+        print(f"Circuit breaker open: {failures} recent failures, pausing all workers for {self.cooldown:.0f}s")
+
+
+BREAKER = CircuitBreaker()
+
+
+def is_retryable(exc):
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(exc, (openai.APIConnectionError, TimeoutError, ConnectionError))
+
+
+def retry_after(exc):
+    """Seconds the server asked us to wait, or None."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_CAP_SEC, BACKOFF_BASE_SEC * 2 ** attempt))
+
+
+def _next_delay(exc, attempt):
+    """Record a failure and return how long to sleep, or None if we should give up."""
+    if not is_retryable(exc):
+        return None
+    BREAKER.record(False)
+    if attempt + 1 >= MAX_ATTEMPTS:
+        return None
+    hint = retry_after(exc)
+    if hint is None:
+        return backoff_delay(attempt)
+    if getattr(exc, "status_code", None) == 429:
+        # Account-level throttling: hold every worker back, not just this one.
+        BREAKER.pause(hint)
+    return hint + random.uniform(0, BACKOFF_BASE_SEC)
+
+
+def retry_call(fn, *args, **kwargs):
+    """Call `fn(*args, **kwargs)`, retrying transient API errors."""
+    for attempt in range(MAX_ATTEMPTS):
+        while BREAKER.wait_time() > 0:
+            time.sleep(BREAKER.wait_time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            delay = _next_delay(exc, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        BREAKER.record(True)
+        return result
+
+
+async def retry_call_async(fn, *args, **kwargs):
+    """Async counterpart of `retry_call` for coroutine functions."""
+    for attempt in range(MAX_ATTEMPTS):
+        while BREAKER.wait_time() > 0:
+            await asyncio.sleep(BREAKER.wait_time())
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as exc:
+            delay = _next_delay(exc, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        BREAKER.record(True)
+        return result
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed on-disk cache of model responses.
+
+The key is a SHA-256 of the canonical JSON of the whole request (model,
+messages and sampling parameters), so any change to the prompt or settings is
+a different entry. Entries live in a small SQLite database shared by every
+script; when it grows past `max_bytes` the least recently used entries are
+evicted. Modes:
+
+    "off"        never read or write
+    "readwrite"  serve hits, store misses
+    "replay"     serve hits, raise CacheMiss instead of calling the API
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_PATH = './cache/responses.sqlite'
+CACHE_MODES = ("off", "readwrite", "replay")
+
+
+class CacheMiss(LookupError):
+    """Raised in replay mode when a request has no cached response."""
+
+
+def request_key(request):
+    canonical = json.dumps(request, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, mode="readwrite", max_bytes=512 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; expected one of {CACHE_MODES}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, content TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self._conn
+
+    def get(self, request):
+        """Cached content for `request`, or None on a miss (CacheMiss in replay mode)."""
+        if self.mode == "off":
+            return None
+        key = request_key(request)
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                db.commit()
+        if row is not None:
+            return row[0]
+        if self.mode == "replay":
+            raise CacheMiss(f"No cached response for request {key[:12]} (replay mode)")
+        return None
+
+    def put(self, request, content):
+        if self.mode != "readwrite" or content is None:
+            return
+        key = request_key(request)
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            old = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, content, size, time.time())
+            )
+            self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict(db)
+            db.commit()
+
+    def _evict(self, db):
+        # Drop least recently used entries until we are comfortably under the limit.
+        target = int(self.max_bytes * 0.9)
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if self._size <= target:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._size -= size
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"{self.hits} hits / {self.misses} misses ({rate:.1%}), mode={self.mode}"
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only JSONL result sink with size-rotated shards and an id index.
+
+An alternative to one pretty-printed JSON file per conversation. Records
+are appended as single lines `{"id": ..., "record": ...}` to
+<dir>/<name>-00000.jsonl, <name>-00001.jsonl, ... A new shard is started
+once the current one would pass `max_shard_bytes`. Every record is one
+write() on an O_APPEND descriptor, so it reaches the OS straight away. A line
+torn by a crash is cut off the next time the sink is opened. A side index,
+<name>.index.jsonl, maps each id to (shard, offset, length), so `get` reads a
+single line instead of scanning. Later records with the same id win.
+
+Uses orjson when it is installed. One process writes a given sink; threads
+within it may share it.
+"""
+import json
+import os
+import threading
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+SHARD_MAX_BYTES = 256 * 1024 * 1024
+
+
+def dumps(obj):
+    """Compact UTF-8 JSON bytes (non-ASCII kept as is)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ShardedSink:
+    def __init__(self, directory, name, max_shard_bytes=SHARD_MAX_BYTES, fsync=False):
+        self.directory = directory
+        self.name = name
+        self.max_shard_bytes = max_shard_bytes
+        self.fsync = fsync
+        self._index = None          # id -> (shard, offset, length); loaded on first use
+        self._shard = 0
+        self._size = 0
+        self._fd = None
+        self._index_fd = None
+        self._lock = threading.Lock()
+
+    def _shard_path(self, shard):
+        return os.path.join(self.directory, f"{self.name}-{shard:05d}.jsonl")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, f"{self.name}.index.jsonl")
+
+    def _shards(self):
+        shard = 0
+        while os.path.exists(self._shard_path(shard)):
+            shard += 1
+        return shard
+
+    def _load(self):
+        if self._index is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._shard = max(0, self._shards() - 1)
+        path = self._shard_path(self._shard)
+        self._size = _repair_tail(path) if os.path.exists(path) else 0
+        self._index = {}
+        if os.path.exists(self.index_path):
+            _repair_tail(self.index_path)
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    entry = loads(line)
+                    self._index[entry["id"]] = (entry["shard"], entry["offset"], entry["length"])
+
+    def _open_fds(self):
+        if self._fd is None:
+            self._fd = os.open(self._shard_path(self._shard), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if self._index_fd is None:
+            self._index_fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, record_id, record):
+        line = dumps({"id": record_id, "record": record}) + b"\n"
+        with self._lock:
+            self._write(record_id, len(line), [line])
+
+    def append_line_file(self, record_id, path, block_size=1 << 20):
+        """
+        Append a record line already serialized to `path` as {"id": record_id,
+        "record": ...} plus a newline, copied in blocks rather than loaded.
+        """
+        with self._lock, open(path, "rb") as f:
+            self._write(record_id, os.path.getsize(path), iter(lambda: f.read(block_size), b""))
+
+    def _write(self, record_id, length, blocks):
+        """Write one line of `length` bytes, given as `blocks`, to the current shard (lock held)."""
+        self._load()
+        if self._size and self._size + length > self.max_shard_bytes:
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = None
+            self._shard += 1
+            self._size = 0
+        self._open_fds()
+        offset = self._size
+        for block in blocks:
+            os.write(self._fd, block)
+        self._size += length
+        entry = {"id": record_id, "shard": self._shard, "offset": offset, "length": length}
+        os.write(self._index_fd, dumps(entry) + b"\n")
+        if self.fsync:
+            os.fsync(self._fd)
+            os.fsync(self._index_fd)
+        self._index[record_id] = (self._shard, offset, length)
+
+    def __contains__(self, record_id):
+        with self._lock:
+            self._load()
+            return record_id in self._index
+
+    def ids(self):
+        with self._lock:
+            self._load()
+            return list(self._index)
+
+    def get(self, record_id):
+        """The latest record stored under `record_id`, or None."""
+        with self._lock:
+            self._load()
+            location = self._index.get(record_id)
+        if location is None:
+            return None
+        shard, offset, length = location
+        with open(self._shard_path(shard), "rb") as f:
+            f.seek(offset)
+            return loads(f.read(length))["record"]
+
+    def records(self):
+        """Every (id, record) in write order, duplicates included."""
+        for shard in range(self._shards()):
+            with open(self._shard_path(shard), "rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        entry = loads(line)
+                        yield entry["id"], entry["record"]
+
+    def rebuild_index(self):
+        """Recreate the index from the shards (after it was lost or hand-edited)."""
+        with self._lock:
+            self.close()
+            self._index = None
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            self._load()
+            self._open_fds()
+            for shard in range(self._shards()):
+                offset = 0
+                with open(self._shard_path(shard), "rb") as f:
+                    for line in f:
+                        record_id = loads(line)["id"]
+                        entry = {"id": record_id, "shard": shard, "offset": offset, "length": len(line)}
+                        os.write(self._index_fd, dumps(entry) + b"\n")
+                        self._index[record_id] = (shard, offset, len(line))
+                        offset += len(line)
+
+    def close(self):
+        for fd in (self._fd, self._index_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._index_fd = None
+
+
+def _repair_tail(path):
+    """Cut a torn final line left by an interrupted write; returns the file size."""
+    size = os.path.getsize(path)
+    if not size:
+        return 0
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b"\n":
+            return size
+        f.seek(0)
+        keep = f.read().rfind(b"\n") + 1
+        f.truncate(keep)
+        return keep
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Turn sampling and running estimates for adaptive (sampled) evaluation.
+
+TurnSampler hands out therapist turns stratified two ways:
+- By conversation. It round-robins over the conversations in random order,
+  so every conversation gets its first scored turn before any gets a second.
+- By position. Each conversation's turns are split into early / middle /
+  late thirds, and successive picks rotate through them.
+
+ClusterMeans keeps the scores that come back and estimates each
+dimension's corpus mean. A conversation with N turns, m of which are
+scored, contributes its sample mean with weight N. That is the mean over
+all turns, with conversations of different lengths weighted correctly. The
+interval uses the cluster-robust (linearization) variance of that ratio
+estimator: turns of one conversation are correlated, so the spread between
+conversations, not between turns, sets the precision.
+"""
+import math
+
+
+class TurnSampler:
+    def __init__(self, conversations, rng, position_strata=3):
+        """`conversations` maps a key to the list of its turn ids in conversation order."""
+        self._order = [key for key, turns in conversations.items() if turns]
+        rng.shuffle(self._order)
+        self._strata = {}
+        self._taken = {}
+        self._offset = {}
+        for n, key in enumerate(self._order):
+            turns = conversations[key]
+            strata = [turns[len(turns) * s // position_strata:len(turns) * (s + 1) // position_strata]
+                      for s in range(position_strata)]
+            for stratum in strata:
+                rng.shuffle(stratum)
+            self._strata[key] = strata
+            self._taken[key] = 0
+            self._offset[key] = n % position_strata   # spread the first picks over all positions
+        self._cursor = 0
+        self.remaining = sum(len(turns) for turns in conversations.values())
+
+    @property
+    def exhausted(self):
+        return self.remaining == 0
+
+    def next(self):
+        """(key, turn id) of the next turn to score, or None once every turn has been handed out."""
+        while self._order:
+            if self._cursor >= len(self._order):
+                self._cursor = 0
+            key = self._order[self._cursor]
+            strata = self._strata[key]
+            first = (self._offset[key] + self._taken[key]) % len(strata)
+            for s in range(len(strata)):
+                stratum = strata[(first + s) % len(strata)]
+                if stratum:
+                    self._taken[key] += 1
+                    self._cursor += 1
+                    self.remaining -= 1
+                    return key, stratum.pop()
+            self._order.pop(self._cursor)             # conversation exhausted
+        return None
+
+    def take(self, key, turn):
+        """Mark a turn scored elsewhere (e.g. by an earlier run); False if it was not left to hand out."""
+        for stratum in self._strata.get(key, ()):
+            if turn in stratum:
+                stratum.remove(turn)
+                self._taken[key] += 1
+                self.remaining -= 1
+                return True
+        return False
+
+
+class ClusterMeans:
+    """Running per-dimension means and confidence half-widths over sampled turns."""
+
+    def __init__(self, sizes, dims=7):
+        """`sizes` maps each conversation key to its total number of turns."""
+        self.sizes = sizes
+        self.dims = dims
+        self._sums = {}
+        self._counts = {}
+
+    @property
+    def conversations(self):
+        return len(self._counts)
+
+    @property
+    def turns(self):
+        return sum(self._counts.values())
+
+    def add(self, key, values):
+        sums = self._sums.setdefault(key, [0.0] * self.dims)
+        for d, v in enumerate(values):
+            sums[d] += v
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def estimate(self, z):
+        """[(mean, half_width)] per dimension; half_width is inf with fewer than two conversations."""
+        keys = list(self._counts)
+        if not keys:
+            return [(math.nan, math.inf)] * self.dims
+        weights = [self.sizes[k] for k in keys]
+        total = sum(weights)
+        result = []
+        for d in range(self.dims):
+            cluster_means = [self._sums[k][d] / self._counts[k] for k in keys]
+            mean = sum(w * y for w, y in zip(weights, cluster_means)) / total
+            if len(keys) < 2:
+                result.append((mean, math.inf))
+                continue
+            spread = sum((w * (y - mean)) ** 2 for w, y in zip(weights, cluster_means))
+            variance = len(keys) / (len(keys) - 1) * spread / total ** 2
+            result.append((mean, z * math.sqrt(variance)))
+        return result
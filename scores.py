@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Typed seven-dimension scores: output schemas, a tolerant parser and re-asks.
+
+The evaluator asks for seven 0–3 scores (0.5 steps) per therapist reply. With
+structured output (SCORE_RESPONSE_FORMAT) the API returns them as a typed JSON
+object, one field per dimension. Replies that still do not parse cleanly
+(plain-text mode, older models, batch results) go through `parse_scores`,
+which accepts the bare "2 3 2 2 3 2 3" format, JSON objects or lists, and
+numbered or labelled lists such as "1. Fluency: 2". Whatever is still
+unreadable can be put to a cheap model with `reask_messages`: it sees only
+the malformed answer, never the conversation, and copies the scores into the
+schema.
+"""
+import json
+import re
+import threading
+
+# Dimension order of every rubric in evaluation.py (names are shared across modalities).
+DIMENSIONS = ("d1_language_fluency", "d2_therapeutic_relevance", "d3_role_consistency",
+              "d4_technique_accuracy", "d5_session_flow", "d6_empathy_validation",
+              "d7_engagement_collaboration")
+SCORE_STEPS = [0, 0.5, 1, 1.5, 2, 2.5, 3]
+
+_SCORES_OBJECT = {
+    "type": "object",
+    "properties": {name: {"type": "number", "enum": SCORE_STEPS} for name in DIMENSIONS},
+    "required": list(DIMENSIONS),
+    "additionalProperties": False,
+}
+
+SCORE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "turn_scores", "strict": True, "schema": _SCORES_OBJECT},
+}
+
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "batch_scores",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "scores": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"utterance_index": {"type": "integer"}, "scores": _SCORES_OBJECT},
+                        "required": ["utterance_index", "scores"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["scores"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+REASK_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "recovered_scores",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"found_all_seven": {"type": "boolean"}, "scores": _SCORES_OBJECT},
+            "required": ["found_all_seven", "scores"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+REASK_PROMPT = """
+The text below is an evaluator's answer that should contain seven scores
+(0 to 3 in steps of 0.5), one per dimension, in this order:
+{dimensions}
+
+Copy the seven scores it gives into the JSON fields. Do not judge anything
+yourself. If the answer does not state all seven scores, set found_all_seven
+to false.
+
+Answer:
+{raw}
+"""
+
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?!\w)")
+_NUMBERED = re.compile(r"(?m)^\s*(?:[-*#>]+\s*)*([1-7])\s*[.):、](?!\d)")
+
+
+def valid_scores(values):
+    return (isinstance(values, list) and len(values) == 7
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool)
+                    and 0 <= v <= 3 and (v * 2) == int(v * 2) for v in values))
+
+
+def coerce_scores(value):
+    """Seven floats from a list, a {dimension: score} object or {"scores": ...}; None if not valid."""
+    if isinstance(value, dict):
+        if "scores" in value and len(value) <= 2:
+            return coerce_scores(value["scores"])
+        if all(name in value for name in DIMENSIONS):
+            value = [value[name] for name in DIMENSIONS]
+        elif len(value) == 7:
+            value = list(value.values())
+    if valid_scores(value):
+        return [float(v) for v in value]
+    return None
+
+
+def _scores_in_text(text):
+    """The scores in free text, skipping list numbering like "1." or "3)"; None unless exactly seven."""
+    text = text.replace("**", "")
+    numbers = [float(n) for n in _NUMBER.findall(_NUMBERED.sub("", text))]
+    if valid_scores(numbers):
+        return numbers
+    numbers = [float(n) for n in _NUMBER.findall(text)]
+    if len(numbers) == 14 and numbers[0::2] == [1, 2, 3, 4, 5, 6, 7]:
+        numbers = numbers[1::2]                         # "1: 2, 2: 3, ..." on one line
+    elif len(numbers) == 14 and all(n == 3 for n in numbers[1::2]):
+        numbers = numbers[0::2]                         # "2/3, 3/3, ..."
+    return numbers if valid_scores(numbers) else None
+
+
+def parse_scores_detail(raw):
+    """
+    (seven floats, how) for a scoring answer, where `how` is "strict" (the
+    bare seven-number format), "json" or "tolerant". Raises ValueError when no
+    unambiguous seven scores can be found.
+    """
+    text = (raw or "").strip()
+    try:
+        numbers = [float(x) for x in text.split()]
+    except ValueError:
+        numbers = None
+    if numbers is not None and valid_scores(numbers):
+        return numbers, "strict"
+
+    body = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+    try:
+        values = coerce_scores(json.loads(body))
+    except (json.JSONDecodeError, TypeError):
+        values = None
+    if values is not None:
+        return values, "json"
+
+    values = _scores_in_text(text)
+    if values is not None:
+        return values, "tolerant"
+    raise ValueError(f"Expected 7 scores, got: '{text[:200]}'")
+
+
+def parse_scores(raw):
+    return parse_scores_detail(raw)[0]
+
+
+def reask_messages(raw):
+    """A small request that turns a malformed answer into SCORE_RESPONSE_FORMAT fields."""
+    prompt = REASK_PROMPT.format(dimensions=", ".join(DIMENSIONS), raw=(raw or "").strip()[:4000])
+    return [{"role": "user", "content": prompt}]
+
+
+def parse_reask(raw):
+    """Seven floats from a re-ask answer; ValueError if the original answer had no seven scores."""
+    try:
+        answer = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        raise ValueError(f"Re-ask returned no JSON: '{(raw or '')[:200]}'")
+    values = coerce_scores(answer.get("scores")) if isinstance(answer, dict) else None
+    if values is None or not answer.get("found_all_seven"):
+        raise ValueError("Re-ask found no seven scores in the answer")
+    return values
+
+
+class ParseStats:
+    """How scoring answers were read (strict / json / tolerant / reasked / batch) and how many were lost."""
+
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, how):
+        with self._lock:
+            self.counts[how] = self.counts.get(how, 0) + 1
+
+    def summary(self):
+        if not self.counts:
+            return "no answers parsed"
+        total = sum(self.counts.values())
+        lost = self.counts.get("failed", 0)
+        parts = ", ".join(f"{k} {v}" for k, v in sorted(self.counts.items()))
+        return f"{parts} | {lost / total:.1%} of answers unusable"
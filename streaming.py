@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Streamed chat completions with latency metrics and an early-abort guard.
+
+Each streamed call records time-to-first-token and generation speed
+(completion tokens per second after the first token). A StreamGuard is checked
+as the text arrives; when it trips (too many paragraphs, too many tokens) the
+stream is closed right away and StreamAborted is raised, so the caller can
+regenerate instead of paying for the rest of an output it would discard.
+"""
+import threading
+import time
+
+from telemetry import percentile
+from tokens import count_tokens
+
+
+class StreamAborted(Exception):
+    """The guard rejected a completion while it was still streaming."""
+
+    def __init__(self, reason, text, tokens):
+        super().__init__(f"stream aborted: {reason} after {tokens} tokens")
+        self.reason = reason
+        self.text = text
+        self.tokens = tokens
+
+
+class StreamGuard:
+    """Rejects a reply once it has more than `max_paragraphs` paragraphs or `max_tokens` tokens."""
+
+    def __init__(self, max_tokens=None, max_paragraphs=None):
+        self.max_tokens = max_tokens
+        self.max_paragraphs = max_paragraphs
+
+    def check(self, text, tokens):
+        """Reason to stop the stream now, or None."""
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return "length"
+        if self.max_paragraphs is not None:
+            # Any line break followed by more text starts a new paragraph.
+            paragraphs = [line for line in text.strip().splitlines() if line.strip()]
+            if len(paragraphs) > self.max_paragraphs:
+                return "paragraphs"
+        return None
+
+
+class StreamResult:
+    def __init__(self, content, usage, ttft, elapsed, tokens):
+        self.content = content
+        self.usage = usage
+        self.ttft = ttft
+        self.elapsed = elapsed
+        self.tokens = tokens
+
+
+class _Collector:
+    """Accumulates chunks of one stream and applies the guard to each."""
+
+    def __init__(self, guard, model, started):
+        self.guard = guard
+        self.model = model
+        self.start = started if started is not None else time.perf_counter()
+        self.ttft = None
+        self.parts = []
+        self.tokens = 0
+        self.usage = None
+
+    def feed(self, chunk):
+        if getattr(chunk, "usage", None):
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+        self.parts.append(delta)
+        self.tokens += count_tokens(delta, self.model)
+        if self.guard is not None:
+            text = "".join(self.parts)
+            reason = self.guard.check(text, self.tokens)
+            if reason:
+                raise StreamAborted(reason, text, self.tokens)
+
+    def result(self):
+        elapsed = time.perf_counter() - self.start
+        return StreamResult("".join(self.parts), self.usage, self.ttft, elapsed, self.tokens)
+
+
+def consume_stream(stream, guard=None, model="gpt-4o-mini", started=None):
+    """
+    Read a sync chat-completion stream into a StreamResult; closes it early if
+    the guard trips. `started` is the perf_counter() taken before the request
+    was sent, so TTFT includes the wait for the response headers.
+    """
+    collector = _Collector(guard, model, started)
+    try:
+        for chunk in stream:
+            collector.feed(chunk)
+    finally:
+        stream.close()
+    return collector.result()
+
+
+async def consume_stream_async(stream, guard=None, model="gpt-4o-mini", started=None):
+    collector = _Collector(guard, model, started)
+    try:
+        async for chunk in stream:
+            collector.feed(chunk)
+    finally:
+        await stream.close()
+    return collector.result()
+
+
+class StreamStats:
+    """Run-wide TTFT / tokens-per-second samples and early aborts by reason."""
+
+    def __init__(self):
+        self.ttfts = []
+        self.rates = []
+        self.aborts = {}
+        self.wasted_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            if result.ttft is not None:
+                self.ttfts.append(result.ttft)
+                generating = result.elapsed - result.ttft
+                if generating > 0 and result.tokens > 1:
+                    self.rates.append((result.tokens - 1) / generating)
+
+    def record_abort(self, exc):
+        with self._lock:
+            self.aborts[exc.reason] = self.aborts.get(exc.reason, 0) + 1
+            self.wasted_tokens += exc.tokens
+
+    def summary(self):
+        if not self.ttfts:
+            return "no streamed calls"
+        line = (f"{len(self.ttfts)} streams | TTFT p50 {percentile(self.ttfts, 0.5):.2f}s "
+                f"p95 {percentile(self.ttfts, 0.95):.2f}s")
+        if self.rates:
+            line += f" | {sum(self.rates) / len(self.rates):.1f} tokens/s"
+        if self.aborts:
+            reasons = ", ".join(f"{k} {v}" for k, v in sorted(self.aborts.items()))
+            line += f" | aborted early: {reasons} ({self.wasted_tokens:,} tokens discarded)"
+        return line
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Per-call telemetry for every model request: latency, tokens, retries and cost.
+
+Each call is wrapped in a CallSpan. Every attempt the retry loop makes is
+counted on it, and so is the time the attempt spent queued in the rate limiter.
+When the call finishes, one JSON line goes to the metrics log:
+
+    {"ts", "model", "role", "modality", "status", "latency", "queued", "ttft",
+     "attempts", "prompt_tokens", "cached_tokens", "completion_tokens", "cost"}
+
+status is "ok", "cached" (served by the response cache, no request sent) or
+the exception class name. latency is wall time from the call to its result,
+including queueing and backoff. latency - queued is therefore roughly the time
+spent waiting on the API. The same samples are aggregated per
+(model, role, modality) for the end-of-run summary, which gives latency
+percentiles, retries, token totals and estimated cost.
+
+Cost uses PRICES (USD per million tokens). Models missing from the table
+are counted at zero cost and flagged in the summary.
+"""
+import json
+import os
+import threading
+import time
+
+from checkpoint import write_json_atomic
+
+# USD per 1M tokens: (input, cached input, output). Check the provider's price
+# page before relying on the numbers.
+PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _price(model):
+    """PRICES entry for `model`, also matching dated snapshots like gpt-4o-mini-2024-07-18."""
+    if model in PRICES:
+        return PRICES[model]
+    matches = [name for name in PRICES if model.startswith(name + "-")]
+    return PRICES[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    """Estimated USD for one call, or None when the model has no price."""
+    price = _price(model)
+    if price is None:
+        return None
+    uncached = prompt_tokens - cached_tokens
+    return (uncached * price[0] + cached_tokens * price[1] + completion_tokens * price[2]) / 1e6
+
+
+class CallSpan:
+    """One logical model call; `attempt` is called once per request actually sent."""
+
+    def __init__(self, model, role, modality):
+        self.model = model
+        self.role = role
+        self.modality = modality
+        self.started = time.perf_counter()
+        self.attempts = 0
+        self.queued = 0.0
+        self.ttft = None
+
+    def attempt(self, queued=0.0):
+        self.attempts += 1
+        self.queued += queued or 0.0
+
+
+class _Bucket:
+    def __init__(self):
+        self.latencies = []
+        self.queued = 0.0
+        self.calls = 0
+        self.cached = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.unpriced = False
+
+    def as_dict(self):
+        sent = self.calls - self.cached
+        return {
+            "calls": self.calls,
+            "cached": self.cached,
+            "errors": self.errors,
+            "retries": self.retries,
+            "latency_p50": percentile(self.latencies, 0.5) if self.latencies else None,
+            "latency_p95": percentile(self.latencies, 0.95) if self.latencies else None,
+            "latency_p99": percentile(self.latencies, 0.99) if self.latencies else None,
+            "queued_avg": self.queued / sent if sent else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": None if self.unpriced else round(self.cost, 6),
+        }
+
+
+class Telemetry:
+    """
+    Collects CallSpans from every worker; appends one line per call to
+    `path` (None keeps the numbers in memory only).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._buckets = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def span(self, model, role=None, modality=None):
+        return CallSpan(model, role, modality)
+
+    def finish(self, span, usage=None, status="ok"):
+        """Record a finished call; `usage` is the response's usage object (or None)."""
+        latency = time.perf_counter() - span.started
+        prompt = getattr(usage, "prompt_tokens", None) or 0
+        completion = getattr(usage, "completion_tokens", None) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        cost = estimate_cost(span.model, prompt, cached, completion) if usage else 0.0
+        record = {
+            "ts": round(time.time(), 3),
+            "model": span.model,
+            "role": span.role,
+            "modality": span.modality,
+            "status": status,
+            "latency": round(latency, 4),
+            "queued": round(span.queued, 4),
+            "ttft": None if span.ttft is None else round(span.ttft, 4),
+            "attempts": span.attempts,
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "completion_tokens": completion,
+            "cost": None if cost is None else round(cost, 8),
+        }
+        with self._lock:
+            bucket = self._buckets.setdefault((span.model, span.role, span.modality), _Bucket())
+            bucket.calls += 1
+            if status == "cached":
+                bucket.cached += 1
+            else:
+                bucket.latencies.append(latency)
+                bucket.queued += span.queued
+                bucket.retries += max(0, span.attempts - 1)
+                if status != "ok":
+                    bucket.errors += 1
+            bucket.prompt_tokens += prompt
+            bucket.cached_tokens += cached
+            bucket.completion_tokens += completion
+            if cost is None:
+                bucket.unpriced = True
+            else:
+                bucket.cost += cost
+            if self.path:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def totals(self):
+        """{"model|role|modality": aggregate dict} for every key seen so far."""
+        with self._lock:
+            return {"|".join(str(part) for part in key): bucket.as_dict()
+                    for key, bucket in sorted(self._buckets.items(), key=lambda item: tuple(map(str, item[0])))}
+
+    def summary(self):
+        totals = self.totals()
+        if not totals:
+            return "no model calls"
+        lines, cost, unpriced = [], 0.0, False
+        for key, t in totals.items():
+            line = f"  {key}: {t['calls']} calls"
+            if t["cached"] or t["errors"]:
+                line += f" ({t['cached']} cached, {t['errors']} failed)"
+            if t["latency_p50"] is not None:
+                line += (f" | latency p50 {t['latency_p50']:.2f}s p95 {t['latency_p95']:.2f}s "
+                         f"p99 {t['latency_p99']:.2f}s, queued {t['queued_avg']:.2f}s avg")
+            line += (f" | {t['retries']} retries | tokens {t['prompt_tokens']:,} in "
+                     f"({t['cached_tokens']:,} cached) / {t['completion_tokens']:,} out")
+            if t["cost"] is None:
+                line += " | cost unknown (model not in telemetry.PRICES)"
+                unpriced = True
+            else:
+                line += f" | ${t['cost']:.4f}"
+                cost += t["cost"]
+            lines.append(line)
+        lines.append(f"  estimated cost: ${cost:.4f}" + (" (+ unpriced models)" if unpriced else ""))
+        return "\n".join(lines)
+
+    def write_summary(self, path):
+        """Write the aggregates as JSON (e.g. next to the metrics log)."""
+        write_json_atomic(path, self.totals(), indent=2)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
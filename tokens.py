@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Local token counting for prompts and completions.
+
+Uses tiktoken when it is installed; otherwise falls back to a cheap estimate
+(one token per CJK character, roughly four characters per token elsewhere),
+which is close enough for rate limiting and budgeting.
+"""
+import re
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_encoders = {}
+
+
+def _encoder(model):
+    enc = _encoders.get(model)
+    if enc is None:
+        try:
+            enc = tiktoken.encoding_for_model(model)
+        except KeyError:
+            enc = tiktoken.get_encoding("o200k_base")
+        _encoders[model] = enc
+    return enc
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    """Return the (estimated) number of tokens in `text`."""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoder(model).encode(text))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages, model="gpt-4o-mini"):
+    """Token count of a chat `messages` list, including per-message overhead."""
+    return sum(count_tokens(m["content"], model) + 4 for m in messages) + 2
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Local checks of therapist turns against the mechanical rules of the therapist prompts.
+
+Every therapist prompt in GenerateConv.py asks for the same things:
+- keep the reply in one paragraph
+- use at most two emojis
+- balance questions (about 30%) with supportive statements
+- never deliver the instructions themselves
+
+These are checkable without a model. `feature_table` computes a few
+cheap features for a list of turns in one pass, as one column per feature.
+`violation_table` then applies every rule as a comparison over those
+columns:
+
+    empty             nothing but whitespace
+    paragraphs        more than MAX_PARAGRAPHS non-empty lines
+    emojis            more than MAX_EMOJIS emojis (a ZWJ sequence or flag counts once)
+    questions         at least MIN_SENTENCES_FOR_RATIO sentences, more than
+                      MAX_QUESTION_RATIO of them questions (an interrogation,
+                      not a balanced reply)
+    instruction_dump  the reply repeats the prompt: more than MAX_PROMPT_OVERLAP
+                      of its 8-word shingles appear verbatim in the reference
+                      prompt, or it carries the prompt's structure (headings,
+                      "Role: System", a list of three or more items)
+
+GenerateConv regenerates violating turns (batch mode only records them),
+and evaluation.py screens turns before they go to the paid scorer.
+"""
+import functools
+import re
+import threading
+
+MAX_PARAGRAPHS = 1
+MAX_EMOJIS = 2
+MAX_QUESTION_RATIO = 0.6
+MIN_SENTENCES_FOR_RATIO = 3
+MAX_PROMPT_OVERLAP = 0.3
+SHINGLE_WORDS = 8
+RULES = ("empty", "paragraphs", "emojis", "questions", "instruction_dump")
+
+_EMOJI_CHAR = "[\U0001F300-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u2300-\u23FF]"
+_EMOJI = re.compile(
+    "(?:[\U0001F1E6-\U0001F1FF]{2}"                   # flag: a pair of regional indicators
+    f"|{_EMOJI_CHAR}(?:[\uFE0F\U0001F3FB-\U0001F3FF]|\u200D{_EMOJI_CHAR})*)"   # variation, skin tone, ZWJ
+)
+_SENTENCE_END = re.compile(
+    r"[!?\u2026\uFF1F\uFF01\u3002][.!?\u2026\uFF1F\uFF01\u3002]*"   # ! ? and full-width stops: Chinese puts no space after them
+    r"|\.+(?=[\s\"'\u201D\u2019)\]]|$)"                             # ASCII . only before a space, closing quote or the end
+)
+_WORD = re.compile(r"\w+(?:['’]\w+)*")
+_HEADING = re.compile(r"(?m)^\s*#{1,6}\s+\S")
+_LIST_ITEM = re.compile(r"(?m)^\s*(?:[-*•]|\d+[.)])\s+\S")
+_PROMPT_MARKERS = ("role: system", "instructions for response generation", "therapist instructions",
+                   "emoji integration")
+
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+@functools.lru_cache(maxsize=16)
+def _prompt_shingles(prompt):
+    return frozenset(_shingles(prompt))
+
+
+def features(text, reference=None):
+    """Feature dict of one turn; `reference` is the prompt it must not repeat (optional)."""
+    text = text or ""
+    stripped = text.strip()
+    ends = list(_SENTENCE_END.finditer(stripped))
+    tail = stripped[ends[-1].end():] if ends else stripped
+    sentences = len(ends) + bool(_WORD.search(tail))            # text after the last stop is a sentence too
+    shingles = _shingles(stripped) if reference else ()
+    overlap = len(shingles & _prompt_shingles(reference)) / len(shingles) if shingles else 0.0
+    lowered = stripped.lower()
+    return {
+        "chars": len(stripped),
+        "paragraphs": sum(1 for line in stripped.splitlines() if line.strip()),
+        "emojis": len(_EMOJI.findall(stripped)),
+        "sentences": sentences,
+        "questions": sum(1 for end in ends if "?" in end.group() or "\uFF1F" in end.group()),
+        "prompt_overlap": overlap,
+        "structure": (bool(_HEADING.search(stripped)) or len(_LIST_ITEM.findall(stripped)) >= 3
+                      or any(marker in lowered for marker in _PROMPT_MARKERS)),
+    }
+
+
+def feature_table(texts, reference=None):
+    """{feature: [value per turn]} for a list of turns."""
+    rows = [features(text, reference) for text in texts]
+    return {name: [row[name] for row in rows] for name in (rows[0] if rows else features(""))}
+
+
+def violation_table(table):
+    """{rule: [bool per turn]}, every rule applied to the whole feature table."""
+    return {
+        "empty": [chars == 0 for chars in table["chars"]],
+        "paragraphs": [p > MAX_PARAGRAPHS for p in table["paragraphs"]],
+        "emojis": [e > MAX_EMOJIS for e in table["emojis"]],
+        "questions": [s >= MIN_SENTENCES_FOR_RATIO and q > MAX_QUESTION_RATIO * s
+                      for s, q in zip(table["sentences"], table["questions"])],
+        "instruction_dump": [o > MAX_PROMPT_OVERLAP or s
+                             for o, s in zip(table["prompt_overlap"], table["structure"])],
+    }
+
+
+def check_turns(texts, reference=None):
+    """The violated rules of every turn, in RULES order ([] for a clean turn)."""
+    broken = violation_table(feature_table(texts, reference))
+    return [[rule for rule in RULES if broken[rule][i]] for i in range(len(texts))]
+
+
+def check(text, reference=None):
+    return check_turns([text], reference)[0]
+
+
+class RuleStats:
+    """
+    Turns checked, violations by rule, what became of them (fixed, kept,
+    skipped, flagged) and, separately, how many replies were regenerated.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.flagged = 0
+        self.rules = {}
+        self.outcomes = {}
+        self.regenerations = 0
+        self._lock = threading.Lock()
+
+    def record(self, violations, outcome=None):
+        with self._lock:
+            self.turns += 1
+            if violations:
+                self.flagged += 1
+                for rule in violations:
+                    self.rules[rule] = self.rules.get(rule, 0) + 1
+            if outcome:
+                self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def regenerated(self):
+        """A reply was thrown away and asked for again (not a turn of its own)."""
+        with self._lock:
+            self.regenerations += 1
+
+    def as_dict(self):
+        return {"turns": self.turns, "flagged": self.flagged, "rules": dict(self.rules),
+                "outcomes": dict(self.outcomes), "regenerations": self.regenerations}
+
+    def summary(self):
+        if not self.turns:
+            return "no turns checked"
+        rules = ", ".join(f"{k} {v}" for k, v in sorted(self.rules.items())) or "none"
+        line = f"{self.flagged}/{self.turns} turns broke a rule ({self.flagged / self.turns:.1%}; {rules})"
+        if self.outcomes:
+            line += " | " + ", ".join(f"{k} {v}" for k, v in sorted(self.outcomes.items()))
+        if self.regenerations:
+            line += f" | {self.regenerations} regenerations"
+        return line
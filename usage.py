@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Run-wide token usage counters, including provider-side prompt-cache hits.
+
+`response.usage.prompt_tokens_details.cached_tokens` reports how many prompt
+tokens were served from the provider's prefix cache; the ratio of cached to
+prompt tokens is what the chat message layout is meant to push up.
+"""
+import threading
+
+
+class UsageStats:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+            self.cached_tokens += cached
+
+    @property
+    def cache_hit_rate(self):
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def summary(self):
+        return (f"{self.calls} calls | prompt tokens {self.prompt_tokens:,} "
+                f"(cached {self.cached_tokens:,}, {self.cache_hit_rate:.1%}) | "
+                f"completion tokens {self.completion_tokens:,}")